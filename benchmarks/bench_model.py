@@ -0,0 +1,124 @@
+import json
+import platform
+import statistics
+import sys
+import time
+
+import click
+
+from fairsharing_proxy.consts import PACKAGE_VERSION
+from fairsharing_proxy.model import Record, RecordSet, SearchQuery
+
+from benchmarks.payloads import make_items, make_queries
+
+
+def _measure(func, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _summary(timings: list[float], items: int) -> dict:
+    best = min(timings)
+    return {
+        'items': items,
+        'repeat': len(timings),
+        'min_s': best,
+        'median_s': statistics.median(timings),
+        'mean_s': statistics.fmean(timings),
+        'stdev_s': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'per_item_us': best / items * 1e6 if items > 0 else 0.0,
+    }
+
+
+def run_benchmarks(records: int, queries: int, repeat: int) -> dict:
+    items = make_items(records)
+    raw_queries = make_queries(queries)
+    parsed = [Record(**item) for item in items]
+    rows = [r.to_row() for r in parsed]
+    search_queries = [SearchQuery.from_params(q) for q in raw_queries]
+    texts = [r.description for r in parsed]
+
+    def bench_init():
+        for item in items:
+            Record(**item)
+
+    def bench_optimize_text():
+        for text in texts:
+            Record.optimize_text(text)
+
+    def bench_rectify():
+        # rectify is idempotent, so repeated runs measure the same work
+        RecordSet([Record(**item) for item in items]).rectify()
+
+    def bench_to_json():
+        for r in parsed:
+            r.to_json()
+
+    def bench_to_legacy_json():
+        for r in parsed:
+            r.to_legacy_json()
+
+    def bench_record_set_to_json():
+        json.dumps(RecordSet(parsed).to_json())
+
+    def bench_to_row():
+        for r in parsed:
+            r.to_row()
+
+    def bench_from_row():
+        for row in rows:
+            Record().from_row(row)
+
+    def bench_query_params():
+        for q in search_queries:
+            _ = q.params
+
+    cases = [
+        ('record_init', bench_init, records),
+        ('record_optimize_text', bench_optimize_text, records),
+        ('record_init_rectify', bench_rectify, records),
+        ('record_to_json', bench_to_json, records),
+        ('record_to_legacy_json', bench_to_legacy_json, records),
+        ('record_set_to_json_dumps', bench_record_set_to_json, records),
+        ('record_to_row', bench_to_row, records),
+        ('record_from_row', bench_from_row, records),
+        ('search_query_params', bench_query_params, queries),
+    ]
+    return {
+        'meta': {
+            'suite': 'model',
+            'package_version': PACKAGE_VERSION,
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'records': records,
+            'queries': queries,
+        },
+        'results': {
+            name: _summary(_measure(func, repeat), count)
+            for name, func, count in cases
+        },
+    }
+
+
+@click.command()
+@click.option('-n', '--records', default=4000, show_default=True,
+              help='Number of synthetic records.')
+@click.option('-q', '--queries', default=1000, show_default=True,
+              help='Number of synthetic search queries.')
+@click.option('-r', '--repeat', default=10, show_default=True,
+              help='Repetitions of each benchmark.')
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help='Output JSON file (stdout by default).')
+def main(records, queries, repeat, output):
+    result = run_benchmarks(records=records, queries=queries, repeat=repeat)
+    json.dump(result, output, indent=2)
+    output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import json
+import platform
+import sys
+
+import click
+
+from fairsharing_proxy import payload
+from fairsharing_proxy.consts import PACKAGE_VERSION
+from fairsharing_proxy.model import Record
+from fairsharing_proxy.snapshot import encode_json
+
+from benchmarks.bench_model import _measure, _summary
+from benchmarks.payloads import make_items, make_page
+
+
+def _make_content(page_size: int, invalid: float) -> bytes:
+    items = make_items(page_size)
+    for item in items[:int(page_size * invalid)]:
+        # no name, such items are dropped by the client
+        item['attributes']['name'] = ''
+        item['attributes']['metadata']['name'] = ''
+    return encode_json(make_page(items, page_size=page_size))
+
+
+def _parse_eager(content: bytes) -> list[Record]:
+    # previous client: response decoded twice, every item constructed
+    result = json.loads(content).get('data', [])
+    records = [rec for rec in (Record(**item) for item in result)
+               if rec.is_valid()]
+    _ = json.loads(content).get('links', {}).get('next', None)
+    return records
+
+
+def _parse_payload(content: bytes, use_orjson: bool) -> list[Record]:
+    has_orjson = payload.HAS_ORJSON
+    payload.HAS_ORJSON = has_orjson and use_orjson
+    try:
+        page = payload.Payload(content)
+        records = page.records()
+        _ = page.next_url
+    finally:
+        payload.HAS_ORJSON = has_orjson
+    return records
+
+
+def run_benchmarks(page_size: int, invalid: float, repeat: int) -> dict:
+    content = _make_content(page_size, invalid)
+    cases = [
+        ('page_eager_json', lambda: _parse_eager(content)),
+        ('page_payload_json', lambda: _parse_payload(content, False)),
+    ]
+    if payload.HAS_ORJSON:
+        cases.append(('page_payload_orjson', lambda: _parse_payload(content, True)))
+    expected = [r.to_json() for r in _parse_eager(content)]
+    for name, func in cases:
+        assert [r.to_json() for r in func()] == expected, name
+    return {
+        'meta': {
+            'suite': 'payload',
+            'package_version': PACKAGE_VERSION,
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'page_size': page_size,
+            'page_bytes': len(content),
+            'invalid': invalid,
+            'orjson': payload.HAS_ORJSON,
+        },
+        'results': {
+            name: _summary(_measure(func, repeat), page_size)
+            for name, func in cases
+        },
+    }
+
+
+@click.command()
+@click.option('-n', '--page-size', default=2000, show_default=True,
+              help='Number of items in the page.')
+@click.option('-i', '--invalid', default=0.1, show_default=True,
+              help='Fraction of invalid items in the page.')
+@click.option('-r', '--repeat', default=20, show_default=True,
+              help='Repetitions of each benchmark.')
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help='Output JSON file (stdout by default).')
+def main(page_size, invalid, repeat, output):
+    result = run_benchmarks(page_size=page_size, invalid=invalid, repeat=repeat)
+    json.dump(result, output, indent=2)
+    output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import json
+import platform
+import sys
+import tempfile
+
+import click
+
+from typing import Callable
+
+from fairsharing_proxy import search
+from fairsharing_proxy.consts import PACKAGE_VERSION
+from fairsharing_proxy.model import Record, SearchQuery
+from fairsharing_proxy.snapshot import SnapshotStore
+
+from benchmarks.bench_model import _measure, _summary
+from benchmarks.payloads import make_items, widen_vocabulary
+
+# combinations of filters from broad to narrow
+_FILTERS = [
+    ('filters_1', {'registry': 'standard'}),
+    ('filters_2', {'registry': 'standard,database', 'status': 'ready'}),
+    ('filters_4', {'registry': 'standard,database', 'status': 'ready',
+                   'subjects': 'biology,chemistry', 'countries': 'germany'}),
+    ('filters_7', {'registry': 'standard,database', 'status': 'ready',
+                   'record_type': 'repository,knowledgebase',
+                   'subjects': 'biology,chemistry,medicine',
+                   'domains': 'imaging,climate', 'countries': 'germany,japan',
+                   'user_defined_tags': 'fair,metadata'}),
+]
+
+
+def _build_index(records: list[Record], columnar: bool) -> search.LocalSearchIndex:
+    has_numpy = search.HAS_NUMPY
+    search.HAS_NUMPY = has_numpy and columnar
+    try:
+        index = search.LocalSearchIndex()
+        index.build(records)
+    finally:
+        search.HAS_NUMPY = has_numpy
+    return index
+
+
+def _map_index(records: list[Record], directory: str) -> search.LocalSearchIndex:
+    store = SnapshotStore(directory)
+    store.publish(records)
+    store.refresh()
+    assert store.current is not None
+    return store.current.search_index()
+
+
+def _parse(items: list[dict]) -> list[Record]:
+    records = [Record(**item) for item in items]
+    for record in records:
+        record.rectify()
+    return records
+
+
+def _cases(records: list[Record], limit: int, prefix: str,
+           directory: str) -> tuple[list[tuple[str, Callable]], int]:
+    """Cases for the records and memory of columnar facets (bytes)"""
+    variants = [('python', _build_index(records, columnar=False))]
+    if search.HAS_NUMPY:
+        variants.append(('numpy', _build_index(records, columnar=True)))
+    variants.append(('mapped', _map_index(records, directory)))
+    cases = []
+    for filters_name, params in _FILTERS:
+        for query_name, text in (('browse', None), ('query', 'data')):
+            query = SearchQuery.from_params(dict(params, q=text or ''))
+            for variant, index in variants:
+                cases.append((
+                    f'{prefix}{query_name}_{filters_name}_{variant}',
+                    lambda i=index, q=query: i.search(q, limit),
+                ))
+    # results must not depend on the representation
+    functions = dict(cases)
+    for name, func in cases:
+        variant = name.rsplit('_', maxsplit=1)[1]
+        if variant != 'python':
+            python = functions[name[:-len(variant)] + 'python']
+            assert [r.fairsharing_id for r in func()] == \
+                [r.fairsharing_id for r in python()], name
+    columns = variants[-1][1].columns
+    return cases, columns.nbytes
+
+
+def run_benchmarks(records: int, limit: int, repeat: int) -> dict:
+    items = make_items(records)
+    with tempfile.TemporaryDirectory() as directory:
+        cases, facet_bytes = _cases(
+            _parse(items), limit, prefix='', directory=f'{directory}/small',
+        )
+        # FAIRsharing-like vocabularies (thousands of subjects, domains, ...)
+        large_cases, large_facet_bytes = _cases(
+            _parse(widen_vocabulary(items)), limit, prefix='large_vocabulary_',
+            directory=f'{directory}/large',
+        )
+        results = {
+            name: _summary(_measure(func, repeat), 1)
+            for name, func in cases + large_cases
+        }
+    return {
+        'meta': {
+            'suite': 'search',
+            'package_version': PACKAGE_VERSION,
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'records': records,
+            'limit': limit,
+            'numpy': search.HAS_NUMPY,
+            'facet_bytes': facet_bytes,
+            'large_vocabulary_facet_bytes': large_facet_bytes,
+        },
+        'results': results,
+    }
+
+
+@click.command()
+@click.option('-n', '--records', default=4000, show_default=True,
+              help='Number of synthetic records.')
+@click.option('-l', '--limit', default=100, show_default=True,
+              help='Maximal number of returned records.')
+@click.option('-r', '--repeat', default=100, show_default=True,
+              help='Repetitions of each benchmark.')
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help='Output JSON file (stdout by default).')
+def main(records, limit, repeat, output):
+    result = run_benchmarks(records=records, limit=limit, repeat=repeat)
+    json.dump(result, output, indent=2)
+    output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
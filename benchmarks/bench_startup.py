@@ -0,0 +1,146 @@
+import asyncio
+import datetime
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+
+import click
+
+from fairsharing_proxy.consts import ENV_CONFIG, PACKAGE_VERSION
+
+from benchmarks.bench_model import _summary
+from benchmarks.payloads import make_items
+
+# each measurement runs in a fresh interpreter, the child prints seconds
+# elapsed since its start (interpreter startup itself is not included)
+_IMPORT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+'''
+
+_BOOT_SCRIPT = '''
+import asyncio, time
+start = time.perf_counter()
+from fairsharing_proxy.api import app
+from fairsharing_proxy.core import CORE
+
+async def boot():
+    await CORE.startup()
+    ready = time.perf_counter()
+    await CORE.shutdown()
+    return ready
+
+print(asyncio.run(boot()) - start)
+'''
+
+_CLI_SCRIPT = '''
+import time
+start = time.perf_counter()
+from fairsharing_proxy.cli import cli
+try:
+    cli(['--help'], obj={})
+except SystemExit:
+    pass
+print(time.perf_counter() - start)
+'''
+
+
+def _write_config(directory: pathlib.Path, records: int) -> pathlib.Path:
+    config_file = directory / 'config.yml'
+    config_file.write_text(json.dumps({
+        'fairsharing': {'api': 'http://localhost:1'},
+        'logging': {'level': 'WARNING'},
+        'cache': {
+            'enabled': records > 0,
+            'file': str(directory / 'cache.db'),
+            'serve_search': True,
+        },
+    }), encoding='utf-8')
+    return config_file
+
+
+def _seed_cache(config_file: pathlib.Path, records: int):
+    from fairsharing_proxy.cache import RecordsCache
+    from fairsharing_proxy.config import cfg_parser
+    from fairsharing_proxy.model import Record
+
+    with config_file.open() as fp:
+        cfg = cfg_parser.parse_file(fp)
+    cache = RecordsCache(cfg)
+    items = [Record(**item) for item in make_items(records)]
+    now = datetime.datetime.now()
+
+    async def seed():
+        await cache.prepare()
+        try:
+            await cache.db.write(cache._replace_records, items,
+                                 'Benchmark', now, now)
+        finally:
+            await cache.finalize()
+
+    asyncio.run(seed())
+
+
+def _run_child(script: str, env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, '-c', script],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def run_benchmarks(records: int, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        config_file = _write_config(pathlib.Path(tmp), records)
+        if records > 0:
+            _seed_cache(config_file, records)
+        env = dict(os.environ)
+        env[ENV_CONFIG] = str(config_file)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [os.getcwd()] + [p for p in [env.get('PYTHONPATH')] if p]
+        )
+        cases = [
+            ('import_package', _IMPORT_SCRIPT.format(module='fairsharing_proxy')),
+            ('import_cli', _IMPORT_SCRIPT.format(module='fairsharing_proxy.cli')),
+            ('import_api', _IMPORT_SCRIPT.format(module='fairsharing_proxy.api')),
+            ('cli_help', _CLI_SCRIPT),
+            ('boot_ready', _BOOT_SCRIPT),
+        ]
+        results = {
+            name: _summary([_run_child(script, env) for _ in range(repeat)], 1)
+            for name, script in cases
+        }
+    return {
+        'meta': {
+            'suite': 'startup',
+            'package_version': PACKAGE_VERSION,
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'records': records,
+        },
+        'results': results,
+    }
+
+
+@click.command()
+@click.option('-n', '--records', default=4000, show_default=True,
+              help='Number of synthetic records in cache (0 disables cache).')
+@click.option('-r', '--repeat', default=5, show_default=True,
+              help='Repetitions of each benchmark.')
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help='Output JSON file (stdout by default).')
+def main(records, repeat, output):
+    result = run_benchmarks(records=records, repeat=repeat)
+    json.dump(result, output, indent=2)
+    output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import json
+
+import click
+
+
+@click.command()
+@click.argument('baseline', type=click.File('r'))
+@click.argument('current', type=click.File('r'))
+@click.option('-m', '--metric', default='min_s', show_default=True,
+              help='Metric of the results to compare.')
+def main(baseline, current, metric):
+    """Compare two JSON outputs of the same benchmark suite"""
+    base = json.load(baseline).get('results', {})
+    curr = json.load(current).get('results', {})
+    click.echo(f'{"benchmark":<32} {"baseline":>12} {"current":>12} {"change":>9}')
+    for name in sorted(set(base.keys()) | set(curr.keys())):
+        old = base.get(name, {}).get(metric, None)
+        new = curr.get(name, {}).get(metric, None)
+        if old is None or new is None:
+            click.echo(f'{name:<32} {str(old):>12} {str(new):>12} {"n/a":>9}')
+            continue
+        change = (new - old) / old * 100 if old > 0 else 0.0
+        click.echo(f'{name:<32} {old:>12.6f} {new:>12.6f} {change:>+8.1f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import random
+import string
+
+
+REGISTRIES = ['standard', 'database', 'policy', 'collection']
+RECORD_TYPES = ['terminology_artefact', 'model_and_format', 'repository',
+                'knowledgebase', 'reporting_guideline', 'identifier_schema',
+                'journal', 'funder', 'project']
+STATUSES = ['ready', 'in_development', 'uncertain', 'deprecated']
+SUBJECTS = ['Biology', 'Life Science', 'Chemistry', 'Earth Science',
+            'Medicine', 'Genomics', 'Ecology', 'Agriculture',
+            'Social Science', 'Computer Science', 'Humanities', 'Physics']
+DOMAINS = ['Gene expression', 'Protein structure', 'Metabolomics',
+           'Imaging', 'Climate', 'Clinical trial', 'Biodiversity',
+           'Sequence annotation', 'Phenotype', 'Pathway model']
+TAXONOMIES = ['Homo sapiens', 'Mus musculus', 'Arabidopsis thaliana',
+              'Escherichia coli', 'Danio rerio', 'All taxonomies']
+COUNTRIES = ['Czech Republic', 'United Kingdom', 'Germany', 'France',
+             'United States', 'Netherlands', 'Japan', 'Australia']
+TAGS = ['ontology', 'metadata', 'FAIR', 'data sharing', 'curation',
+        'interoperability', 'archive', 'workflow', 'provenance']
+
+
+def _words(rnd: random.Random, count: int) -> str:
+    return ' '.join(
+        ''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 10)))
+        for _ in range(count)
+    )
+
+
+def make_item(rnd: random.Random, number: int) -> dict:
+    """Single item as returned in `data` of FAIRsharing API"""
+    abbreviation = ''.join(rnd.choices(string.ascii_uppercase,
+                                       k=rnd.randint(2, 8)))
+    name = f'{_words(rnd, rnd.randint(2, 6)).title()} {number}'
+    description = _words(rnd, rnd.randint(40, 120))
+    if rnd.random() < 0.3:
+        name = f'FAIRsharing record for: {name}'
+    if rnd.random() < 0.3:
+        description = f'FAIRsharing record for: {description}'
+    return {
+        'id': str(number),
+        'type': 'fairsharing_records',
+        'attributes': {
+            'fairsharing_registry': rnd.choice(REGISTRIES).title(),
+            'record_type': rnd.choice(RECORD_TYPES),
+            'abbreviation': abbreviation,
+            'doi': f'10.25504/FAIRsharing.{number:06d}'
+                   if rnd.random() < 0.8 else None,
+            'name': name,
+            'description': description,
+            'url': f'https://fairsharing.org/{number}',
+            'subjects': rnd.sample(SUBJECTS, rnd.randint(0, 4)),
+            'domains': rnd.sample(DOMAINS, rnd.randint(0, 5)),
+            'taxonomies': rnd.sample(TAXONOMIES, rnd.randint(0, 3)),
+            'user_defined_tags': rnd.sample(TAGS, rnd.randint(0, 4)),
+            'countries': rnd.sample(COUNTRIES, rnd.randint(0, 3)),
+            'fairsharing_licence': 'CC BY-SA 4.0',
+            'legacy_ids': [f'bsg-{rnd.choice("sdp")}{number:06d}'],
+            'created_at': '2015-03-12T10:25:31.000Z',
+            'updated_at': f'2022-{rnd.randint(1, 12):02d}-'
+                          f'{rnd.randint(1, 28):02d}T08:00:00.000Z',
+            'metadata': {
+                'name': name,
+                'description': description,
+                'homepage': f'https://{abbreviation.lower()}.example.org',
+                'status': rnd.choice(STATUSES),
+            },
+        },
+    }
+
+
+def make_items(count: int, seed: int = 42) -> list[dict]:
+    rnd = random.Random(seed)
+    return [make_item(rnd, number) for number in range(1, count + 1)]
+
+
+# vocabulary sizes of multi-valued facets similar to FAIRsharing
+LARGE_VOCABULARY = {
+    'subjects': (SUBJECTS, 800),
+    'domains': (DOMAINS, 3000),
+    'taxonomies': (TAXONOMIES, 1500),
+    'user_defined_tags': (TAGS, 4000),
+}
+
+
+def widen_vocabulary(items: list[dict], seed: int = 42) -> list[dict]:
+    """Replace values of multi-valued facets by values drawn from large
+    vocabularies (the same number of values per item, common values kept)"""
+    rnd = random.Random(seed)
+    vocabularies = {
+        attr: common + [f'{attr} {_words(rnd, 2)} {n}'
+                        for n in range(size - len(common))]
+        for attr, (common, size) in LARGE_VOCABULARY.items()
+    }
+    for item in items:
+        attributes = item['attributes']
+        for attr, vocabulary in vocabularies.items():
+            attributes[attr] = rnd.sample(vocabulary, len(attributes[attr]))
+    return items
+
+
+def make_page(items: list[dict], page_size: int = 500) -> dict:
+    """Payload of a single page of /fairsharing_records"""
+    return {
+        'data': items[:page_size],
+        'links': {
+            'self': None,
+            'first': None,
+            'prev': None,
+            'next': None,
+            'last': None,
+        },
+    }
+
+
+def make_queries(count: int, seed: int = 42) -> list[dict]:
+    rnd = random.Random(seed)
+    return [{
+        'q': _words(rnd, rnd.randint(1, 3)),
+        'registry': rnd.choice(REGISTRIES + [None]),
+        'status': rnd.choice(STATUSES + [None]),
+        'subjects': rnd.choice(SUBJECTS + [None]),
+        'is_recommended': rnd.choice(['true', 'false', None]),
+    } for _ in range(count)]
@@ -1,4 +1,17 @@
-from fairsharing_proxy.api import app
-from fairsharing_proxy.cli import main
+import importlib
+
+# app and main are imported on first access, so that e.g. the CLI does not
+# pay for importing FastAPI and the proxy core does not load config early
+_LAZY_ATTRIBUTES = {
+    'app': 'fairsharing_proxy.api',
+    'main': 'fairsharing_proxy.cli',
+}
 
 __all__ = ['app', 'main']
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name])
+        return getattr(module, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
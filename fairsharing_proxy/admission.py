@@ -0,0 +1,119 @@
+import asyncio
+import collections
+import contextlib
+import math
+import time
+
+from typing import AsyncIterator, Counter, Deque, Optional, OrderedDict
+
+
+class AdmissionRejectedError(Exception):
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Limits concurrent upstream calls globally and per client
+
+    Waiting requests are queued per client and released round-robin
+    across clients, so a single client cannot starve the others. When a
+    client's queue is full, its request is rejected right away.
+    """
+
+    EWMA_WEIGHT = 0.2
+
+    def __init__(self, global_limit: int, client_limit: int,
+                 queue_limit: int):
+        self._active = 0
+        self._active_by_client = collections.Counter()  # type: Counter[str]
+        # clients with waiting requests in round-robin order
+        self._queues = \
+            collections.OrderedDict()  # type: OrderedDict[str, Deque[asyncio.Future]]
+        self._duration = 1.0  # EWMA of upstream call duration (seconds)
+        self.configure(global_limit, client_limit, queue_limit)
+
+    def configure(self, global_limit: int, client_limit: int,
+                  queue_limit: int):
+        self.global_limit = max(1, global_limit)
+        self.client_limit = max(1, client_limit)
+        self.queue_limit = max(0, queue_limit)
+        # raised limits may admit waiting requests right away
+        self._dispatch()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _can_start(self, client: str) -> bool:
+        return self._active < self.global_limit and \
+            self._active_by_client[client] < self.client_limit
+
+    def _start(self, client: str):
+        self._active += 1
+        self._active_by_client[client] += 1
+
+    def _retry_after(self, client: str) -> int:
+        waiting = len(self._queues.get(client, ())) + 1
+        return max(1, math.ceil(self._duration * waiting / self.client_limit))
+
+    def _dispatch(self):
+        while self._active < self.global_limit:
+            for client, queue in self._queues.items():
+                if self._active_by_client[client] < self.client_limit:
+                    break
+            else:
+                return
+            future = queue.popleft()
+            if len(queue) == 0:
+                del self._queues[client]
+            else:
+                self._queues.move_to_end(client)
+            if future.done():
+                # cancelled in the same loop tick, before removing itself
+                continue
+            self._start(client)
+            future.set_result(None)
+
+    async def acquire(self, client: str):
+        if self._can_start(client) and client not in self._queues:
+            self._start(client)
+            return
+        if len(self._queues.get(client, ())) >= self.queue_limit:
+            raise AdmissionRejectedError(self._retry_after(client))
+        queue = self._queues.setdefault(client, collections.deque())
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # slot was already handed over
+                self.release(client)
+            elif future in queue:
+                queue.remove(future)
+                if len(queue) == 0:
+                    self._queues.pop(client, None)
+            raise
+
+    def release(self, client: str, duration: Optional[float] = None):
+        if duration is not None:
+            self._duration += self.EWMA_WEIGHT * (duration - self._duration)
+        self._active -= 1
+        self._active_by_client[client] -= 1
+        if self._active_by_client[client] <= 0:
+            del self._active_by_client[client]
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, client: str) -> AsyncIterator[None]:
+        await self.acquire(client)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(client, time.monotonic() - started)
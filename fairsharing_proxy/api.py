@@ -32,6 +32,41 @@ async def post_search(request: fastapi.Request):
     return await CORE.search(request=request, is_get=False)
 
 
+@app.post(path='/search/batch')
+async def post_search_batch(request: fastapi.Request):
+    return await CORE.search_batch(request=request)
+
+
+@app.get(path='/autocomplete')
+async def get_autocomplete(request: fastapi.Request):
+    return await CORE.autocomplete(request=request)
+
+
+@app.get(path='/catalogue')
+async def get_catalogue(request: fastapi.Request):
+    return await CORE.get_catalogue(request=request)
+
+
+@app.get(path='/changes')
+async def get_changes(request: fastapi.Request):
+    return await CORE.changes(request=request)
+
+
+@app.get(path='/records/{identifier:path}')
+async def get_record(request: fastapi.Request, identifier: str):
+    return await CORE.get_record(request=request, identifier=identifier)
+
+
+@app.post(path='/records/lookup')
+async def post_records_lookup(request: fastapi.Request):
+    return await CORE.lookup_records(request=request)
+
+
+@app.get(path='/admin/profile', include_in_schema=False)
+async def get_admin_profile(request: fastapi.Request):
+    return await CORE.profile(request=request)
+
+
 @app.on_event("startup")
 async def app_init():
     await CORE.startup()
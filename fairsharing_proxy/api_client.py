@@ -1,8 +1,12 @@
 import asyncio
 import httpx
 
+from typing import Callable, Mapping, Optional
+
 from fairsharing_proxy.config import ProxyConfig
 from fairsharing_proxy.model import Token, Record, SearchQuery
+from fairsharing_proxy.payload import Payload
+from fairsharing_proxy.validators import Validators, content_digest
 
 _NEED_LOGIN_MESSAGE = 'please login before continuing'
 
@@ -26,6 +30,19 @@ class FAIRSharingUnauthorizedError(Exception):
     }
 
 
+class UpstreamResult:
+    """Result of a conditional request, records are None if unchanged"""
+
+    def __init__(self, validators: Validators,
+                 records: Optional[list[Record]] = None):
+        self.validators = validators
+        self.records = records
+
+    @property
+    def unchanged(self) -> bool:
+        return self.records is None
+
+
 class FAIRSharingClient:
 
     def __init__(self, cfg: ProxyConfig):
@@ -36,14 +53,14 @@ class FAIRSharingClient:
         self.timeout = cfg.fairsharing.timeout
 
     @staticmethod
-    def _check_response(response: httpx.Response):
+    def _check_response(response: httpx.Response) -> Payload:
+        response.raise_for_status()
+        payload = Payload(response.content)
         # FAIRSharing is not using HTTP codes... need to check
         # using message string that is human-readable
-        if response.is_success:
-            msg = response.json().get('message', '').lower()
-            if msg == _NEED_LOGIN_MESSAGE:
-                raise FAIRSharingUnauthorizedError()
-        response.raise_for_status()
+        if payload.message.lower() == _NEED_LOGIN_MESSAGE:
+            raise FAIRSharingUnauthorizedError()
+        return payload
 
     async def client_login(
             self, client: httpx.AsyncClient,
@@ -71,21 +88,71 @@ class FAIRSharingClient:
                 password=password,
             )
 
-    async def client_search(
+    async def _client_request(
+            self, client: httpx.AsyncClient, method: str, url: str,
+            token: Token, known: Optional[Validators] = None, **kwargs,
+    ) -> UpstreamResult:
+        headers = _headers_with(token)
+        if known is not None:
+            headers.update(known.request_headers())
+        response = await client.request(
+            method=method,
+            url=url,
+            headers=headers,
+            **kwargs,
+        )
+        if known is not None and response.status_code == 304:
+            return UpstreamResult(validators=known.revalidated(response.headers))
+        digest = content_digest(response.content)
+        if known is not None and response.is_success and digest == known.digest:
+            # upstream without validators, but the same content (no parsing)
+            return UpstreamResult(validators=known.revalidated(response.headers))
+        payload = self._check_response(response)
+        records = payload.records()
+        return UpstreamResult(
+            validators=Validators.from_headers(
+                headers=response.headers,
+                digest=digest,
+                ids=[record.fairsharing_id for record in records],
+                next_url=payload.next_url,
+            ),
+            records=records,
+        )
+
+    async def client_search_conditional(
             self, client: httpx.AsyncClient,
             query: SearchQuery, token: Token,
-    ) -> list[Record]:
+            known: Optional[Validators] = None,
+    ) -> UpstreamResult:
         # TODO: page size? page number?
-        response = await client.post(
+        return await self._client_request(
+            client=client,
+            method='POST',
             url=self.url_search,
+            token=token,
+            known=known,
             params=query.params,
-            headers=_headers_with(token),
             timeout=self.timeout,
         )
-        self._check_response(response)
-        result = response.json().get('data', [])
-        return [rec for rec in (Record(**item) for item in result)
-                if rec.is_valid()]
+
+    async def search_conditional(
+            self, query: SearchQuery, token: Token,
+            known: Optional[Validators] = None,
+    ) -> UpstreamResult:
+        async with httpx.AsyncClient() as client:
+            return await self.client_search_conditional(
+                client=client,
+                query=query,
+                token=token,
+                known=known,
+            )
+
+    async def client_search(
+            self, client: httpx.AsyncClient,
+            query: SearchQuery, token: Token,
+    ) -> list[Record]:
+        result = await self.client_search_conditional(client, query, token)
+        return result.records or []
 
     async def search(
             self, query: SearchQuery, token: Token,
@@ -100,10 +167,7 @@ class FAIRSharingClient:
             url=url,
             headers=_headers_with(token),
         )
-        self._check_response(response)
-        result = response.json().get('data', [])
-        return [rec for rec in (Record(**item) for item in result)
-                if rec.is_valid()]
+        return self._check_response(response).records()
 
     async def client_list_records(
             self, client: httpx.AsyncClient, token: Token,
@@ -138,23 +202,47 @@ class FAIRSharingClient:
                 page_number=page_number,
             )
 
-    async def client_list_records_all(
+    async def client_list_pages(
             self, client: httpx.AsyncClient, token: Token,
             page_size=500, timeout=None, page_delay=None,
-    ) -> list[Record]:
-        next_url = f'{self.url_list}?page[number]=1&page[size]={page_size}'
-        records = list()  # type: list[Record]
+            progress: Optional[Callable[[int, int], None]] = None,
+            known: Optional[Mapping[str, Validators]] = None,
+    ) -> dict[str, UpstreamResult]:
+        """All pages by URL (in order), conditional for known ones"""
+        known = known or dict()
+        first_url = f'{self.url_list}?page[number]=1&page[size]={page_size}'
+        next_url = first_url  # type: Optional[str]
+        pages = dict()  # type: dict[str, UpstreamResult]
+        count = 0
         while next_url is not None:
-            response = await client.get(
+            result = await self._client_request(
+                client=client,
+                method='GET',
                 url=next_url,
-                headers=_headers_with(token),
+                token=token,
+                known=known.get(next_url, None),
                 timeout=timeout or self.timeout,
             )
-            self._check_response(response)
-            result = response.json().get('data', [])
-            records.extend((rec for rec in (Record(**item) for item in result)
-                            if rec.is_valid()))
-            next_url = response.json().get('links', {}).get('next', None)
+            pages[next_url] = result
+            count += len(result.validators.ids)
+            next_url = result.validators.next_url
+            if progress is not None:
+                progress(len(pages), count)
             if page_delay is not None:
                 await asyncio.sleep(page_delay)
-        return records
+        return pages
+
+    async def client_list_records_all(
+            self, client: httpx.AsyncClient, token: Token,
+            page_size=500, timeout=None, page_delay=None,
+            progress: Optional[Callable[[int, int], None]] = None,
+    ) -> list[Record]:
+        pages = await self.client_list_pages(
+            client=client,
+            token=token,
+            page_size=page_size,
+            timeout=timeout,
+            page_delay=page_delay,
+            progress=progress,
+        )
+        return [record for page in pages.values() for record in page.records or []]
@@ -0,0 +1,76 @@
+import array
+import bisect
+
+from typing import Final, Iterable, Iterator, Optional, Sequence, Union
+
+# Indexes keep their data in flat arrays so that the same layout can be
+# built in memory or mapped from a snapshot (see snapshot.py): numbers as
+# array.array or memoryview (native byte order), strings as StringArray.
+
+Numbers = Union[array.array, memoryview]
+Strings = Union[Sequence[str], 'StringArray']
+
+# encoded sections of a snapshot (by name) and mapped ones
+EncodedSections = dict[str, bytes]
+Sections = dict[str, memoryview]
+
+OFFSET = 'Q'  # type: Final
+REF = 'I'  # type: Final
+CODE = 'i'  # type: Final
+WEIGHT = 'f'  # type: Final
+
+
+class StringArray:
+    """Strings in a UTF-8 blob, i-th string is blob[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0 or i >= len(self.offsets) - 1:
+            raise IndexError(i)
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+
+def find(values: Strings, value: str) -> Optional[int]:
+    """Position of the value in sorted strings, None if missing"""
+    i = bisect.bisect_left(values, value)  # type: ignore
+    if i < len(values) and values[i] == value:
+        return i
+    return None
+
+
+def pack_numbers(name: str, typecode: str,
+                 values: Union[Numbers, Iterable[int]]) -> EncodedSections:
+    if isinstance(values, array.array) and values.typecode == typecode:
+        return {name: values.tobytes()}
+    return {name: array.array(typecode, values).tobytes()}
+
+
+def pack_blobs(name: str, items: list[bytes]) -> EncodedSections:
+    offsets = array.array(OFFSET, [0])
+    for item in items:
+        offsets.append(offsets[-1] + len(item))
+    return {f'{name}.offsets': offsets.tobytes(), name: b''.join(items)}
+
+
+def pack_strings(name: str, values: Strings) -> EncodedSections:
+    return pack_blobs(name, [value.encode('utf-8') for value in values])
+
+
+def load_numbers(sections: Sections, name: str, typecode: str) -> memoryview:
+    return sections[name].cast(typecode)  # type: ignore
+
+
+def load_strings(sections: Sections, name: str) -> StringArray:
+    return StringArray(
+        offsets=sections[f'{name}.offsets'].cast(OFFSET),
+        blob=sections[name],
+    )
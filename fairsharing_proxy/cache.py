@@ -1,11 +1,26 @@
+import asyncio
 import datetime
+import gzip
 import httpx
+import json
+import os
 import sqlite3
 
-from fairsharing_proxy.api_client import FAIRSharingClient
+from typing import Callable, Optional, Sequence
+
+from fairsharing_proxy.api_client import FAIRSharingClient, UpstreamResult
+from fairsharing_proxy.catalogue import Catalogue, CatalogueStore
+from fairsharing_proxy.changes import Change, Position, select_changes, \
+    store_changes
 from fairsharing_proxy.config import ProxyConfig
+from fairsharing_proxy.database import Database
+from fairsharing_proxy.index import RecordLookupIndex, PrefixIndex
 from fairsharing_proxy.logger import LOG
+from fairsharing_proxy.migrations import migrate
 from fairsharing_proxy.model import Record
+from fairsharing_proxy.search import LocalSearchIndex
+from fairsharing_proxy.snapshot import Snapshot, SnapshotStore, encode_json
+from fairsharing_proxy.validators import PAGE, Validators, ValidatorStore
 
 
 _QUERY_CREATE_TABLE_RECORDS = '''
@@ -25,6 +40,17 @@ _QUERY_CREATE_TABLE_RECORDS = '''
 '''
 
 
+_RECORD_COLUMNS = (
+    'fairsharing_id', 'registry', 'record_type', 'record_name', 'description',
+    'abbreviation', 'doi', 'url', 'additional', 'created_at', 'updated_at',
+)
+
+_QUERY_INSERT_RECORD = '''
+    INSERT OR REPLACE INTO records
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+'''
+
+
 _QUERY_CREATE_TABLE_META = '''
     CREATE TABLE IF NOT EXISTS meta (
       version       INTEGER,
@@ -45,38 +71,212 @@ _QUERY_CREATE_TABLE_RUNS = '''
 
 class RecordsCache:
 
-    CURRENT_META = 1
-
     def __init__(self, cfg: ProxyConfig):
         self.config = cfg
-        self.records = []  # type: list[Record]
-        self.connection = sqlite3.connect(
-            database=self.config.cache.filename,
+        self.records = []  # type: Sequence[Record]
+        self.lookup = RecordLookupIndex()
+        self.prefixes = PrefixIndex()
+        self.search = LocalSearchIndex()
+        self.snapshots = None  # type: Optional[SnapshotStore]
+        if self.config.cache.snapshot_dir:
+            self.snapshots = SnapshotStore(self.config.cache.snapshot_dir)
+        self.catalogues = None  # type: Optional[CatalogueStore]
+        if self.config.cache.catalogue_dir:
+            self.catalogues = CatalogueStore(self.config.cache.catalogue_dir)
+        self.db = Database(
+            filename=self.config.cache.filename,
+            readers=self.config.cache.readers,
         )
+        self.validators = ValidatorStore(self.db)
+
+    async def prepare(self):
+        await self.db.write(self._init_tables)
+
+    @property
+    def is_loaded(self) -> bool:
+        return len(self.records) > 0
+
+    @property
+    def snapshot(self) -> Optional[Snapshot]:
+        if self.snapshots is None:
+            return None
+        return self.snapshots.current
 
-    def prepare(self):
-        # TODO: check content, clear if needed
-        ...
+    @property
+    def catalogue(self) -> Optional[Catalogue]:
+        if self.catalogues is None:
+            return None
+        return self.catalogues.current
 
-    def finalize(self):
-        self.connection.close()
-        self.connection = None
+    async def finalize(self):
+        await asyncio.to_thread(self.db.close)
+        if self.snapshots is not None:
+            self.snapshots.close()
 
-    def _init_tables(self):
-        cur = self.connection.cursor()
+    @staticmethod
+    def _init_tables(conn: sqlite3.Connection):
+        cur = conn.cursor()
+        # base schema, later changes are done by migrations
         cur.execute(_QUERY_CREATE_TABLE_META)
         cur.execute(_QUERY_CREATE_TABLE_RUNS)
         cur.execute(_QUERY_CREATE_TABLE_RECORDS)
+        migrate(cur)
+        cur.close()
+
+    @staticmethod
+    def _select_records(conn: sqlite3.Connection) -> list[Record]:
+        cur = conn.cursor()
+        # older runs could leave duplicates, the last inserted wins
+        cur.execute('''
+            SELECT * FROM records
+            WHERE rowid IN (
+              SELECT MAX(rowid) FROM records GROUP BY fairsharing_id
+            );
+        ''')
+        records = []
+        for row in cur.fetchall():
+            record = Record()
+            record.from_row(row)
+            records.append(record)
+        cur.close()
+        return records
+
+    @staticmethod
+    def _insert_run(cur: sqlite3.Cursor, records: int, message: str,
+                    start_time: datetime.datetime,
+                    finish_time: datetime.datetime):
         now = datetime.datetime.utcnow()
         cur.execute('''
-            INSERT INTO meta VALUES (?, ?);
-        ''', (self.CURRENT_META, now.isoformat()))
+            INSERT INTO runs VALUES (?, ?, ?, ?, ?);
+        ''', (
+            now.isoformat(),
+            start_time.isoformat(),
+            finish_time.isoformat(),
+            records,
+            message,
+        ))
+
+    def _replace_records(self, conn: sqlite3.Connection, records: list[Record],
+                         message: str, start_time: datetime.datetime,
+                         finish_time: datetime.datetime):
+        cur = conn.cursor()
+        cur.execute('SELECT fairsharing_id, updated_at FROM records;')
+        cached = dict(cur.fetchall())  # type: dict[str, str]
+        fetched = {record.fairsharing_id for record in records}
+        removed = [fid for fid in cached.keys() if fid not in fetched]
+        cur.execute('DELETE FROM records;')
+        cur.executemany(_QUERY_INSERT_RECORD,
+                        (record.to_row() for record in records))
+        # unchanged records keep their position in the change feed
+        store_changes(cur, [
+            record.fairsharing_id for record in records
+            if cached.get(record.fairsharing_id, None) != record.updated_at
+        ], removed, finish_time)
+        self._insert_run(cur, len(records), message, start_time, finish_time)
         cur.close()
-        self.connection.commit()
 
-    async def load_records(self):
-        start_time = datetime.datetime.utcnow()
-        LOG.info('[CACHE] Caching started')
+    def _update_records(self, conn: sqlite3.Connection, records: list[Record],
+                        start_time: datetime.datetime,
+                        finish_time: datetime.datetime) -> dict[str, int]:
+        cur = conn.cursor()
+        cur.execute('SELECT fairsharing_id, updated_at FROM records;')
+        cached = dict(cur.fetchall())  # type: dict[str, str]
+        fetched = {record.fairsharing_id for record in records}
+        changed = [record for record in records
+                   if cached.get(record.fairsharing_id, None) != record.updated_at]
+        changed_ids = [record.fairsharing_id for record in changed]
+        removed = [fid for fid in cached.keys() if fid not in fetched]
+        cur.executemany('DELETE FROM records WHERE fairsharing_id = ?;',
+                        [(fid,) for fid in changed_ids + removed])
+        cur.executemany(_QUERY_INSERT_RECORD,
+                        (record.to_row() for record in changed))
+        store_changes(cur, changed_ids, removed, finish_time)
+        counts = {
+            'added': sum(1 for r in changed if r.fairsharing_id not in cached),
+            'updated': sum(1 for r in changed if r.fairsharing_id in cached),
+            'removed': len(removed),
+        }
+        self._insert_run(cur, len(records),
+                         'Incremental: {added} added, {updated} updated, '
+                         '{removed} removed'.format(**counts),
+                         start_time, finish_time)
+        cur.close()
+        return counts
+
+    def _use_catalogue(self, records: Sequence[Record], publish: bool):
+        if self.catalogues is None:
+            return
+        self.catalogues.refresh()
+        if publish or self.catalogues.current is None:
+            self.catalogues.publish(list(records))
+
+    def _use_records(self, records: list[Record], publish: bool):
+        """Rectify records, (publish snapshot, catalogue), swap in new indexes"""
+        for record in records:
+            record.rectify()
+        self._use_catalogue(records, publish)
+        if publish and self.snapshots is not None:
+            path = self.snapshots.publish(records)
+            self.snapshots.refresh()
+            snapshot = self.snapshot
+            if snapshot is not None and snapshot.path == path:
+                self._use_snapshot(snapshot)
+                return
+        lookup = RecordLookupIndex()
+        lookup.build(records)
+        prefixes = PrefixIndex()
+        prefixes.build(records)
+        search = LocalSearchIndex()
+        search.build(records)
+        self.records, self.lookup, self.prefixes, self.search = \
+            records, lookup, prefixes, search
+        LOG.info(f'[CACHE] Indexes built for {len(records)} records')
+
+    def _use_snapshot(self, snapshot: Snapshot):
+        """Swap in indexes mapped from the snapshot (shared by workers)"""
+        prefixes = snapshot.prefix_index()
+        search = snapshot.search_index()
+        # lookups are served from the snapshot directly
+        self.records, self.lookup, self.prefixes, self.search = \
+            search.records, RecordLookupIndex(), prefixes, search
+        LOG.info(f'[CACHE] Indexes mapped from {snapshot.path.name} '
+                 f'({len(snapshot)} records)')
+
+    async def load_cached_records(self):
+        records = await self.db.read(self._select_records)
+        LOG.info(f'[CACHE] Loaded {len(records)} cached records')
+        await asyncio.to_thread(self._use_records, records, len(records) > 0)
+
+    def _load_snapshot(self) -> bool:
+        if self.snapshots is None or not self.snapshots.refresh():
+            return False
+        snapshot = self.snapshots.current
+        if snapshot is None:
+            return False
+        self._use_catalogue(snapshot.records(), publish=False)
+        self._use_snapshot(snapshot)
+        return True
+
+    async def load_snapshot(self) -> bool:
+        """Load records from the current snapshot if it changed"""
+        return await asyncio.to_thread(self._load_snapshot)
+
+    async def load(self):
+        if not await self.load_snapshot():
+            await self.load_cached_records()
+
+    def find_encoded(self, identifier: str) -> Optional[bytes]:
+        snapshot = self.snapshot
+        if snapshot is not None:
+            ref = snapshot.find(identifier)
+            return None if ref is None else bytes(snapshot.record_json(ref))
+        record = self.lookup.find(identifier)
+        return None if record is None else encode_json(record.to_json())
+
+    async def _fetch_pages(
+            self, known: dict[str, Validators],
+            progress: Optional[Callable[[int, int], None]] = None,
+    ) -> dict[str, UpstreamResult]:
         api_client = FAIRSharingClient(self.config)
         async with httpx.AsyncClient() as client:
             LOG.debug('[CACHE] Login in progress')
@@ -88,39 +288,206 @@ class RecordsCache:
             if not token.ok:
                 LOG.error('[CACHE] Login failed')
             LOG.debug('[CACHE] Login OK')
-            LOG.debug('[CACHE] Requesting all records')
-            self.records = await api_client.client_list_records_all(
+            LOG.debug(f'[CACHE] Requesting all records ({len(known)} known pages)')
+            return await api_client.client_list_pages(
                 client=client,
                 token=token,
                 page_size=self.config.cache.page_size,
                 page_delay=self.config.cache.page_delay,
                 timeout=self.config.cache.page_timeout,
+                progress=progress,
+                known=known,
             )
+
+    async def _fetch_records(
+            self, force: bool,
+            progress: Optional[Callable[[int, int], None]] = None,
+    ) -> tuple[Optional[list[Record]], dict[str, UpstreamResult]]:
+        """Fetched records (None if no page changed) and the pages"""
+        known = dict()  # type: dict[str, Validators]
+        if self.config.cache.conditional and not force:
+            known = await self.validators.get_all(PAGE)
+        pages = await self._fetch_pages(known=known, progress=progress)
+        unchanged = [page for page in pages.values() if page.unchanged]
+        if len(pages) > 0 and len(unchanged) == len(pages) and \
+                pages.keys() == known.keys():
+            return None, pages
+        # records of unchanged pages are the cached ones
+        cached = await self.validators.find_records(
+            [fid for page in unchanged for fid in page.validators.ids]
+        )
+        if cached is None:
+            LOG.warning('[CACHE] Records of unchanged pages are not cached, '
+                        'requesting all pages again')
+            return await self._fetch_records(force=True, progress=progress)
+        by_id = {record.fairsharing_id: record for record in cached}
+        records = []  # type: list[Record]
+        for page in pages.values():
+            if page.records is None:
+                records.extend(by_id[fid] for fid in page.validators.ids)
+            else:
+                records.extend(page.records)
+        return records, pages
+
+    def _store_unchanged(self, conn: sqlite3.Connection, records: int,
+                         start_time: datetime.datetime,
+                         finish_time: datetime.datetime):
+        cur = conn.cursor()
+        self._insert_run(cur, records, 'Not modified', start_time, finish_time)
+        cur.close()
+
+    async def _keep_records(self, pages: dict[str, UpstreamResult],
+                            start_time: datetime.datetime,
+                            finish_time: datetime.datetime) -> dict[str, int]:
+        count = sum(len(page.validators.ids) for page in pages.values())
+        LOG.info(f'[CACHE] No page changed, keeping {count} cached records')
+        await self.db.write(self._store_unchanged, count, start_time, finish_time)
+        if not self.is_loaded:
+            await self.load_cached_records()
+        return {'added': 0, 'updated': 0, 'removed': 0, 'records': count}
+
+    async def refresh(
+            self, incremental=False, force=False,
+            progress: Optional[Callable[[int, int], None]] = None,
+    ) -> dict[str, int]:
+        """Refresh cached records, unchanged pages are not downloaded again
+        (unless forced or disabled in config)"""
+        start_time = datetime.datetime.utcnow()
+        LOG.info('[CACHE] Caching started')
+        records, pages = await self._fetch_records(force=force, progress=progress)
         finish_time = datetime.datetime.utcnow()
-        LOG.info(f'[CACHE] Fetched {len(self.records)} records')
+        unchanged = sum(1 for page in pages.values() if page.unchanged)
+        LOG.info(f'[CACHE] Fetched {len(pages)} pages ({unchanged} unchanged)')
         LOG.info(f'[CACHE] - Start = {start_time}')
         LOG.info(f'[CACHE] - Finish = {finish_time}')
         LOG.info(f'[CACHE] - Elapsed = {finish_time - start_time}')
-        cur = self.connection.cursor()
-        for record in self.records:
-            cur.execute('''
-                INSERT INTO records
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-            ''', record.to_row())
-        now = datetime.datetime.utcnow()
+        if records is None:
+            counts = await self._keep_records(pages, start_time, finish_time)
+        else:
+            counts = await self._store_records(records, incremental,
+                                               start_time, finish_time)
+        await self.validators.replace_all(PAGE, {
+            url: page.validators for url, page in pages.items()
+        })
+        LOG.info('[CACHE] Caching done')
+        counts['pages'] = len(pages)
+        counts['unchanged'] = unchanged
+        return counts
+
+    async def _store_records(self, records: list[Record], incremental: bool,
+                             start_time: datetime.datetime,
+                             finish_time: datetime.datetime) -> dict[str, int]:
+        LOG.info(f'[CACHE] Fetched {len(records)} records')
+        if incremental:
+            counts = await self.db.write(self._update_records, records,
+                                         start_time, finish_time)
+        else:
+            await self.db.write(self._replace_records, records,
+                                'Seems like all is OK', start_time, finish_time)
+            counts = {'added': len(records), 'updated': 0, 'removed': 0}
+        await asyncio.to_thread(self._use_records, records, True)
+        counts['records'] = len(records)
+        return counts
+
+    async def changes(self, after: Position, since: str,
+                      limit: int) -> tuple[list[Change], bool]:
+        return await self.db.read(select_changes, after, since, limit)
+
+    async def load_records(self):
+        await self.refresh()
+
+    @staticmethod
+    def _select_stats(conn: sqlite3.Connection) -> dict:
+        cur = conn.cursor()
         cur.execute('''
-            INSERT INTO runs VALUES (?, ?, ?, ?, ?);
-        ''', (
-            now.isoformat(),
-            start_time.isoformat(),
-            finish_time.isoformat(),
-            len(self.records),
-            'Seems like all is OK',
-        ))
+            SELECT COUNT(*), COUNT(DISTINCT fairsharing_id) FROM records;
+        ''')
+        rows, distinct = cur.fetchone()
+        cur.execute('''
+            SELECT registry, COUNT(*) FROM records
+            GROUP BY registry ORDER BY registry;
+        ''')
+        registries = dict(cur.fetchall())
+        cur.execute('''
+            SELECT created_at, started_at, finished_at, records, message
+            FROM runs ORDER BY created_at DESC LIMIT 10;
+        ''')
+        runs = [dict(zip(('created_at', 'started_at', 'finished_at',
+                          'records', 'message'), row))
+                for row in cur.fetchall()]
         cur.close()
-        self.connection.commit()
-        LOG.info('[CACHE] Caching done')
+        return {
+            'rows': rows,
+            'records': distinct,
+            'duplicates': rows - distinct,
+            'registries': registries,
+            'runs': runs,
+        }
+
+    async def stats(self) -> dict:
+        stats = await self.db.read(self._select_stats)
+        filename = self.config.cache.filename
+        stats['file_size'] = os.path.getsize(filename) \
+            if filename and os.path.exists(filename) else 0
+        return stats
+
+    @staticmethod
+    def _delete_duplicates(conn: sqlite3.Connection) -> int:
+        cur = conn.cursor()
+        cur.execute('''
+            DELETE FROM records
+            WHERE rowid NOT IN (
+              SELECT MAX(rowid) FROM records GROUP BY fairsharing_id
+            );
+        ''')
+        deleted = cur.rowcount
+        cur.close()
+        return deleted
 
-        def query_records(query: str) -> list[Record]:
-            # TODO fts?
-            ...
+    async def dedupe(self) -> int:
+        return await self.db.write(self._delete_duplicates)
+
+    @staticmethod
+    def _vacuum(conn: sqlite3.Connection):
+        conn.commit()
+        conn.execute('VACUUM;')
+
+    async def vacuum(self):
+        await self.db.write(self._vacuum)
+
+    @staticmethod
+    def _export_ndjson(conn: sqlite3.Connection, filename: str) -> int:
+        exported = 0
+        with gzip.open(filename, mode='wt', encoding='utf-8') as fp:
+            for record in RecordsCache._select_records(conn):
+                row = dict(zip(_RECORD_COLUMNS, record.to_row()))
+                fp.write(json.dumps(row, ensure_ascii=False))
+                fp.write('\n')
+                exported += 1
+        return exported
+
+    async def export_ndjson(self, filename: str) -> int:
+        return await self.db.read(self._export_ndjson, filename)
+
+    @staticmethod
+    def _read_ndjson(filename: str) -> list[Record]:
+        records = []
+        with gzip.open(filename, mode='rt', encoding='utf-8') as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                record = Record()
+                record.from_row(tuple(data[column] for column in _RECORD_COLUMNS))
+                records.append(record)
+        return records
+
+    async def import_ndjson(self, filename: str) -> int:
+        start_time = datetime.datetime.utcnow()
+        records = await asyncio.to_thread(self._read_ndjson, filename)
+        finish_time = datetime.datetime.utcnow()
+        await self.db.write(self._replace_records, records,
+                            f'Imported from {os.path.basename(filename)}',
+                            start_time, finish_time)
+        await asyncio.to_thread(self._use_records, records, True)
+        return len(records)
@@ -0,0 +1,141 @@
+import datetime
+import gzip
+import hashlib
+import json
+import pathlib
+
+from typing import Optional
+
+from fairsharing_proxy.logger import LOG
+from fairsharing_proxy.model import Record, RecordSet
+from fairsharing_proxy.snapshot import encode_json, write_atomic
+
+# Full catalogue (all cached records in Record.to_json shape) is encoded
+# once per refresh and stored in all supported encodings, the POINTER
+# file describes the current files so that other workers can serve them.
+
+POINTER = 'CURRENT'
+KEEP_CATALOGUES = 2
+
+IDENTITY = 'identity'
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+_SUFFIXES = {
+    IDENTITY: '.json',
+    GZIP: '.json.gz',
+    ZSTD: '.json.zst',
+}
+
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 15
+
+
+def _compressors() -> dict:
+    compressors = {
+        IDENTITY: lambda data: data,
+        GZIP: lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0),
+    }
+    try:
+        import zstandard
+        compressors[ZSTD] = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+    except ImportError:
+        LOG.debug('[CATALOGUE] Package "zstandard" not installed, no zstd encoding')
+    return compressors
+
+
+def encode_catalogue(records: list[Record]) -> bytes:
+    # ordered, so the same records give the same content (and ETag)
+    ordered = sorted(records, key=lambda r: r.fairsharing_id)
+    return encode_json({
+        'data': [record.to_json() for record in ordered],
+        'note': RecordSet.NOTE,
+    })
+
+
+class Catalogue:
+
+    def __init__(self, directory: pathlib.Path, digest: str,
+                 files: dict[str, str]):
+        self.directory = directory
+        self.digest = digest
+        self.files = files
+
+    def etag(self, encoding: str) -> str:
+        if encoding == IDENTITY:
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*':
+                return True
+            tag = tag[2:] if tag.startswith('W/') else tag
+            if tag.strip('"').split('-', maxsplit=1)[0] == self.digest:
+                return True
+        return False
+
+    def path(self, encoding: str) -> pathlib.Path:
+        return self.directory / self.files[encoding]
+
+
+class CatalogueStore:
+
+    def __init__(self, directory: str):
+        self.directory = pathlib.Path(directory)
+        self.current = None  # type: Optional[Catalogue]
+
+    @property
+    def _pointer(self) -> pathlib.Path:
+        return self.directory / POINTER
+
+    def publish(self, records: list[Record]):
+        data = encode_catalogue(records)
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        self.refresh()
+        if self.current is not None and self.current.digest == digest:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        files = dict()  # type: dict[str, str]
+        for encoding, compress in _compressors().items():
+            name = f'catalogue-{now}-{digest[:16]}{_SUFFIXES[encoding]}'
+            write_atomic(self.directory / name, compress(data))
+            files[encoding] = name
+        write_atomic(self._pointer, encode_json({
+            'digest': digest,
+            'files': files,
+        }))
+        LOG.info(f'[CATALOGUE] Published {len(records)} records '
+                 f'({", ".join(files.keys())})')
+        self._cleanup(keep=set(files.values()))
+        self.refresh()
+
+    def _cleanup(self, keep: set[str]):
+        # every published catalogue has files with the same prefix
+        prefixes = sorted({
+            p.name.split('.', maxsplit=1)[0]
+            for p in self.directory.glob('catalogue-*') if p.name not in keep
+        })
+        for prefix in prefixes[:max(0, len(prefixes) - KEEP_CATALOGUES + 1)]:
+            for path in self.directory.glob(f'{prefix}.*'):
+                path.unlink(missing_ok=True)
+
+    def refresh(self) -> bool:
+        """Use the catalogue from pointer if it changed, True if it did"""
+        try:
+            pointer = json.loads(self._pointer.read_bytes())
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            LOG.warning(f'[CATALOGUE] Invalid pointer: {str(e)}')
+            return False
+        if self.current is not None and self.current.digest == pointer['digest']:
+            return False
+        self.current = Catalogue(
+            directory=self.directory,
+            digest=pointer['digest'],
+            files=pointer['files'],
+        )
+        return True
@@ -0,0 +1,115 @@
+import base64
+import binascii
+import datetime
+import json
+import sqlite3
+
+from typing import Optional
+
+from fairsharing_proxy.model import Record
+
+# position in the feed: local change sequence number, every write or delete
+# of a record gets a new (greater) one, continuation tokens point right
+# after the last returned change
+Position = int
+
+START = 0  # type: Position
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def format_timestamp(value: datetime.datetime) -> str:
+    """UTC timestamp in the same format as updated_at of records"""
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='milliseconds') + 'Z'
+
+
+def parse_since(value: str) -> str:
+    try:
+        timestamp = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise InvalidCursorError(f'Invalid timestamp: {value}')
+    # inclusive, changes at exactly the timestamp are included
+    return format_timestamp(timestamp)
+
+
+def encode_cursor(position: Position) -> str:
+    data = json.dumps([position], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Position:
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        assert isinstance(data, list) and len(data) == 1
+        assert isinstance(data[0], int) and data[0] >= 0
+    except (AssertionError, ValueError, binascii.Error):
+        raise InvalidCursorError(f'Invalid cursor: {token}')
+    return data[0]
+
+
+class Change:
+
+    def __init__(self, seq: int, changed_at: str, fairsharing_id: str,
+                 record: Optional[Record] = None):
+        self.seq = seq
+        # local time of the change (not updated_at from upstream)
+        self.changed_at = changed_at
+        self.fairsharing_id = fairsharing_id
+        # tombstone of a deleted record if None
+        self.record = record
+
+    @property
+    def position(self) -> Position:
+        return self.seq
+
+    def to_json(self) -> dict:
+        return {
+            'id': self.fairsharing_id,
+            'changed_at': self.changed_at,
+            'deleted': self.record is None,
+            'record': None if self.record is None else self.record.to_json(),
+        }
+
+
+def select_changes(conn: sqlite3.Connection, after: Position, since: str,
+                   limit: int) -> tuple[list[Change], bool]:
+    """Changes after the position (and since the local time) and whether
+    there are more of them"""
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT changes.seq, changes.changed_at, changes.fairsharing_id,
+               records.*
+        FROM changes
+        LEFT JOIN records ON NOT changes.deleted
+          AND records.fairsharing_id = changes.fairsharing_id
+        WHERE changes.seq > ? AND changes.changed_at >= ?
+        ORDER BY changes.seq
+        LIMIT ?;
+    ''', (after, since, limit + 1))
+    changes = []
+    for row in cur.fetchall():
+        record = None
+        if row[3] is not None:
+            record = Record()
+            record.from_row(row[3:])
+            record.rectify()
+        changes.append(Change(row[0], row[1], row[2], record))
+    cur.close()
+    return changes[:limit], len(changes) > limit
+
+
+def store_changes(cur: sqlite3.Cursor, updated_ids: list[str],
+                  deleted_ids: list[str], changed_at: datetime.datetime):
+    """Move records to the end of the feed (as updated or deleted)"""
+    timestamp = format_timestamp(changed_at)
+    # replaced row gets a new sequence number (AUTOINCREMENT never reuses)
+    cur.executemany('''
+        INSERT OR REPLACE INTO changes (fairsharing_id, changed_at, deleted)
+        VALUES (?, ?, ?);
+    ''', [(fid, timestamp, 0) for fid in updated_ids] +
+        [(fid, timestamp, 1) for fid in deleted_ids])
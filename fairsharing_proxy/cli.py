@@ -1,7 +1,7 @@
 import asyncio
 import click
+import time
 
-from fairsharing_proxy.cache import RecordsCache
 from fairsharing_proxy.config import cfg_parser, ProxyConfig
 from fairsharing_proxy.consts import ENV_CONFIG, DEFAULT_ENCODING, DEFAULT_CONFIG
 
@@ -16,17 +16,113 @@ def cli(ctx, config_file):
     ctx.obj['cfg'] = cfg
 
 
-@cli.command()
-@click.pass_context
-def cache_test(ctx):
+def _run_with_cache(ctx, func):
     cfg = ctx.obj['cfg']  # type: ProxyConfig
     if not cfg.cache.enabled:
         click.echo('Caching is not enabled')
         exit(1)
+    # imported only here as it pulls in the HTTP client
+    from fairsharing_proxy.cache import RecordsCache
     cache = RecordsCache(cfg)
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(cache.load_records())
-    cache.finalize()
+
+    async def run():
+        await cache.prepare()
+        try:
+            return await func(cache)
+        finally:
+            await cache.finalize()
+
+    return asyncio.run(run())
+
+
+class _Progress:
+
+    def __init__(self):
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def __call__(self, page: int, records: int):
+        elapsed = self.elapsed
+        click.echo(f'Page {page}: {records} records in {elapsed:.1f}s '
+                   f'({records / max(elapsed, 1e-6):.1f} records/s)', err=True)
+
+
+@cli.command()
+@click.pass_context
+def cache_test(ctx):
+    _run_with_cache(ctx, lambda cache: cache.load_records())
+
+
+@cli.command()
+@click.pass_context
+@click.option('-i', '--incremental', is_flag=True,
+              help='Update only new, changed and removed records.')
+@click.option('-f', '--force', is_flag=True,
+              help='Download all pages even if unchanged since last refresh.')
+def cache_refresh(ctx, incremental, force):
+    progress = _Progress()
+    counts = _run_with_cache(ctx, lambda cache: cache.refresh(
+        incremental=incremental,
+        force=force,
+        progress=progress,
+    ))
+    elapsed = progress.elapsed
+    click.echo(f'Refreshed {counts["records"]} records in {elapsed:.1f}s '
+               f'({counts["records"] / max(elapsed, 1e-6):.1f} records/s)')
+    click.echo(f'Added: {counts["added"]}, updated: {counts["updated"]}, '
+               f'removed: {counts["removed"]}')
+    click.echo(f'Pages: {counts["pages"]} ({counts["unchanged"]} unchanged)')
+
+
+@cli.command()
+@click.pass_context
+def cache_stats(ctx):
+    stats = _run_with_cache(ctx, lambda cache: cache.stats())
+    click.echo(f'Records: {stats["records"]} '
+               f'(rows: {stats["rows"]}, duplicates: {stats["duplicates"]})')
+    for registry, count in stats['registries'].items():
+        click.echo(f'  {registry}: {count}')
+    click.echo(f'File size: {stats["file_size"]} bytes')
+    click.echo('Last runs:')
+    for run in stats['runs']:
+        click.echo(f'  {run["created_at"]} | {run["records"]} records | '
+                   f'{run["started_at"]} - {run["finished_at"]} | '
+                   f'{run["message"]}')
+
+
+@cli.command()
+@click.pass_context
+def cache_dedupe(ctx):
+    deleted = _run_with_cache(ctx, lambda cache: cache.dedupe())
+    click.echo(f'Deleted {deleted} duplicate rows')
+
+
+@cli.command()
+@click.pass_context
+def cache_vacuum(ctx):
+    _run_with_cache(ctx, lambda cache: cache.vacuum())
+    click.echo('Cache database vacuumed')
+
+
+@cli.command()
+@click.pass_context
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+def cache_export(ctx, output):
+    """Export cached records as gzipped NDJSON"""
+    exported = _run_with_cache(ctx, lambda cache: cache.export_ndjson(output))
+    click.echo(f'Exported {exported} records to {output}')
+
+
+@cli.command()
+@click.pass_context
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+def cache_import(ctx, source):
+    """Replace cached records with gzipped NDJSON export"""
+    imported = _run_with_cache(ctx, lambda cache: cache.import_ndjson(source))
+    click.echo(f'Imported {imported} records from {source}')
 
 
 def main():
@@ -0,0 +1,174 @@
+import array
+
+from typing import Callable, Optional
+
+from fairsharing_proxy.arrays import CODE, OFFSET, REF, EncodedSections, \
+    Numbers, Sections, Strings, find, load_numbers, load_strings, \
+    pack_numbers, pack_strings
+from fairsharing_proxy.model import Record
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:  # optional, filters are then evaluated without vectorization
+    HAS_NUMPY = False
+
+Filters = list[tuple[str, frozenset[str]]]
+
+
+class FacetColumns:
+    """Columnar facets of records for filtering (vectorized with NumPy)
+
+    Single-valued facets are stored as categorical codes (one per record,
+    position of the value in sorted values), multi-valued ones as sorted
+    records of each value (CSR layout: offsets per value into one array of
+    records), so their size depends on the number of assigned values and
+    not on the size of vocabularies. The arrays are built in memory or
+    mapped from a snapshot. Filter values are lowercase, any of the values
+    of a filter must match and all filters must match.
+    """
+
+    def __init__(self, single: dict[str, str], multi: dict[str, str],
+                 vectorized: bool):
+        self.single = single
+        self.multi = multi
+        self.vectorized = vectorized and HAS_NUMPY
+        self.count = 0
+        self.order = array.array(REF)  # type: Numbers
+        self.values = dict()  # type: dict[str, Strings]
+        self.codes = dict()  # type: dict[str, Numbers]
+        self.offsets = dict()  # type: dict[str, Numbers]
+        self.rows = dict()  # type: dict[str, Numbers]
+
+    def build(self, records: list[Record], order: Numbers):
+        """Build columns, order is used for listing of matching records"""
+        self.count = len(records)
+        self.order = order
+        for facet, attr in self.single.items():
+            values = [(getattr(r, attr) or '').lower() for r in records]
+            categories = sorted(set(values))
+            codes = {v: code for code, v in enumerate(categories)}
+            self.values[facet] = categories
+            self.codes[facet] = array.array(CODE, (codes[v] for v in values))
+        for facet, attr in self.multi.items():
+            refs = dict()  # type: dict[str, list[int]]
+            for ref, record in enumerate(records):
+                for value in {v.lower() for v in getattr(record, attr)}:
+                    refs.setdefault(value, []).append(ref)
+            offsets = array.array(OFFSET, [0])
+            rows = array.array(REF)
+            for value in sorted(refs.keys()):
+                rows.extend(refs[value])
+                offsets.append(len(rows))
+            self.values[facet] = sorted(refs.keys())
+            self.offsets[facet] = offsets
+            self.rows[facet] = rows
+
+    def to_sections(self, prefix: str) -> EncodedSections:
+        sections = dict()  # type: EncodedSections
+        for facet in self.single.keys():
+            sections.update(pack_strings(f'{prefix}.{facet}.values',
+                                         self.values[facet]))
+            sections.update(pack_numbers(f'{prefix}.{facet}.codes', CODE,
+                                         self.codes[facet]))
+        for facet in self.multi.keys():
+            sections.update(pack_strings(f'{prefix}.{facet}.values',
+                                         self.values[facet]))
+            sections.update(pack_numbers(f'{prefix}.{facet}.offsets', OFFSET,
+                                         self.offsets[facet]))
+            sections.update(pack_numbers(f'{prefix}.{facet}.rows', REF,
+                                         self.rows[facet]))
+        return sections
+
+    def load_sections(self, sections: Sections, prefix: str, count: int,
+                      order: Numbers):
+        self.count = count
+        self.order = order
+        for facet in self.single.keys():
+            self.values[facet] = load_strings(sections, f'{prefix}.{facet}.values')
+            self.codes[facet] = load_numbers(sections, f'{prefix}.{facet}.codes',
+                                             CODE)
+        for facet in self.multi.keys():
+            self.values[facet] = load_strings(sections, f'{prefix}.{facet}.values')
+            self.offsets[facet] = load_numbers(sections,
+                                               f'{prefix}.{facet}.offsets', OFFSET)
+            self.rows[facet] = load_numbers(sections, f'{prefix}.{facet}.rows', REF)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the arrays (without values of facets)"""
+        arrays = [self.order] + list(self.codes.values()) + \
+            list(self.offsets.values()) + list(self.rows.values())
+        return sum(memoryview(a).nbytes for a in arrays)  # type: ignore
+
+    def _positions(self, facet: str, values: frozenset[str]) -> list[int]:
+        positions = [find(self.values[facet], v) for v in values]
+        return [p for p in positions if p is not None]
+
+    def _facet_mask(self, facet: str,
+                    values: frozenset[str]) -> 'numpy.ndarray':
+        positions = self._positions(facet, values)
+        if facet in self.codes:
+            selected = numpy.zeros(len(self.values[facet]), dtype=numpy.bool_)
+            selected[positions] = True
+            return selected[numpy.frombuffer(self.codes[facet], dtype=numpy.int32)]
+        offsets = self.offsets[facet]
+        rows = numpy.frombuffer(self.rows[facet], dtype=numpy.uint32)
+        mask = numpy.zeros(self.count, dtype=numpy.bool_)
+        for position in positions:
+            mask[rows[offsets[position]:offsets[position + 1]]] = True
+        return mask
+
+    def mask(self, filters: Filters) -> Optional['numpy.ndarray']:
+        """Boolean mask of matching records, None if there are no filters"""
+        result = None
+        for facet, values in filters:
+            facet_mask = self._facet_mask(facet, values)
+            result = facet_mask if result is None else result & facet_mask
+        return result
+
+    def _facet_refs(self, facet: str, values: frozenset[str]) -> set[int]:
+        positions = self._positions(facet, values)
+        if facet in self.codes:
+            selected = set(positions)
+            return {ref for ref, code in enumerate(self.codes[facet])
+                    if code in selected}
+        offsets, rows = self.offsets[facet], self.rows[facet]
+        refs = set()  # type: set[int]
+        for position in positions:
+            refs.update(rows[offsets[position]:offsets[position + 1]])
+        return refs
+
+    def refs(self, filters: Filters) -> Optional[set[int]]:
+        """Matching records (without NumPy), None if there are no filters"""
+        result = None  # type: Optional[set[int]]
+        for facet, values in filters:
+            facet_refs = self._facet_refs(facet, values)
+            result = facet_refs if result is None else result & facet_refs
+        return result
+
+    def matcher(self, filters: Filters) -> Callable[[int], bool]:
+        if len(filters) == 0:
+            return lambda ref: True
+        if self.vectorized:
+            mask = self.mask(filters)
+            return lambda ref: bool(mask[ref])  # type: ignore
+        refs = self.refs(filters) or set()
+        return lambda ref: ref in refs
+
+    def select(self, filters: Filters, limit: int) -> list[int]:
+        """First matching records (limit) in the order given in build"""
+        if self.vectorized:
+            order = numpy.frombuffer(self.order, dtype=numpy.uint32)
+            mask = self.mask(filters)
+            if mask is not None:
+                order = order[mask[order]]
+            return order[:limit].tolist()
+        refs = self.refs(filters)
+        result = []  # type: list[int]
+        for ref in self.order:
+            if len(result) >= limit:
+                break
+            if refs is None or ref in refs:
+                result.append(ref)
+        return result
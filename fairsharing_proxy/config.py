@@ -1,8 +1,9 @@
-import yaml
+import pathlib
 
-from typing import List
+from typing import List, Optional
 
-from fairsharing_proxy.consts import DEFAULT_LOG_LEVEL, DEFAULT_LOG_FORMAT
+from fairsharing_proxy.consts import DEFAULT_LOG_LEVEL, DEFAULT_LOG_FORMAT, \
+    BATCH_MAX_QUERIES
 
 
 class MissingConfigurationError(Exception):
@@ -11,6 +12,13 @@ class MissingConfigurationError(Exception):
         self.missing = missing
 
 
+class InvalidConfigurationError(Exception):
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
 class FAIRSharingConfig:
 
     def __init__(self, api: str, timeout: float):
@@ -22,7 +30,9 @@ class CacheConfig:
 
     def __init__(self, enabled: bool, username: str, password: str,
                  filename: str, page_delay: float, page_size: int,
-                 page_timeout: int):
+                 page_timeout: int, serve_search: bool, search_limit: int,
+                 snapshot_dir: str, snapshot_check: float, readers: int,
+                 catalogue_dir: str, conditional: bool):
         self.enabled = enabled
         self.username = username
         self.password = password
@@ -30,6 +40,62 @@ class CacheConfig:
         self.page_delay = page_delay
         self.page_size = page_size
         self.page_timeout = page_timeout
+        self.serve_search = serve_search
+        self.search_limit = search_limit
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_check = snapshot_check
+        self.readers = readers
+        self.catalogue_dir = catalogue_dir
+        self.conditional = conditional
+
+
+class ResultsConfig:
+
+    def __init__(self, size: int, ttl: float, negative_ttl: float,
+                 prewarm: int, prewarm_delay: float, stats_flush: float,
+                 persistent: bool, sweep: float):
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.prewarm = prewarm
+        self.prewarm_delay = prewarm_delay
+        self.stats_flush = stats_flush
+        self.persistent = persistent
+        self.sweep = sweep
+
+
+class AdmissionConfig:
+
+    def __init__(self, enabled: bool, global_limit: int, client_limit: int,
+                 queue_limit: int):
+        self.enabled = enabled
+        self.global_limit = global_limit
+        self.client_limit = client_limit
+        self.queue_limit = queue_limit
+
+
+class TokensConfig:
+
+    def __init__(self, persistent: bool, filename: str, secret: str):
+        self.persistent = persistent
+        self.filename = filename
+        self.secret = secret
+
+
+class ProfilerConfig:
+
+    def __init__(self, enabled: bool, token: str, max_duration: float,
+                 interval: float):
+        self.enabled = enabled
+        self.token = token
+        self.max_duration = max_duration
+        self.interval = interval
+
+
+class ReloadConfig:
+
+    def __init__(self, check: float):
+        self.check = check
 
 
 class LoggingConfig:
@@ -42,10 +108,47 @@ class LoggingConfig:
 class ProxyConfig:
 
     def __init__(self, fairsharing: FAIRSharingConfig, logging: LoggingConfig,
-                 cache: CacheConfig):
+                 cache: CacheConfig, tokens: TokensConfig,
+                 results: ResultsConfig, admission: AdmissionConfig,
+                 reload: ReloadConfig, profiler: ProfilerConfig):
         self.fairsharing = fairsharing
         self.logging = logging
         self.cache = cache
+        self.tokens = tokens
+        self.results = results
+        self.admission = admission
+        self.reload = reload
+        self.profiler = profiler
+
+    def retain_static(self, previous: 'ProxyConfig') -> List[str]:
+        """Keep settings that cannot change without restart from previous
+
+        Returns names of such settings that differed.
+        """
+        retained = []
+        for section, attr in STATIC_SETTINGS:
+            old_value = getattr(getattr(previous, section), attr)
+            if getattr(getattr(self, section), attr) != old_value:
+                setattr(getattr(self, section), attr, old_value)
+                retained.append(f'{section}.{attr}')
+        return retained
+
+
+# settings used only when the proxy starts (others can be reloaded)
+STATIC_SETTINGS = [
+    ('fairsharing', 'api'),
+    ('logging', 'format'),
+    ('cache', 'enabled'),
+    ('cache', 'filename'),
+    ('cache', 'snapshot_dir'),
+    ('cache', 'catalogue_dir'),
+    ('cache', 'readers'),
+    ('tokens', 'persistent'),
+    ('tokens', 'filename'),
+    ('tokens', 'secret'),
+    ('results', 'persistent'),
+    ('reload', 'check'),
+]
 
 
 class ProxyConfigParser:
@@ -66,13 +169,59 @@ class ProxyConfigParser:
             'page_delay': 20,
             'page_size': 500,
             'page_timeout': 20,
-        }
+            'serve_search': False,
+            'search_limit': 100,
+            'snapshot_dir': '',
+            'snapshot_check': 30,
+            'readers': 2,
+            'catalogue_dir': '',
+            'conditional': True,
+        },
+        'results': {
+            'size': 1000,
+            'ttl': 600,
+            'negative_ttl': 60,
+            'prewarm': 0,
+            'prewarm_delay': 1,
+            'stats_flush': 60,
+            'persistent': False,
+            'sweep': 300,
+        },
+        'admission': {
+            'enabled': False,
+            'global_limit': 20,
+            'client_limit': 4,
+            'queue_limit': 21,
+        },
+        'tokens': {
+            'persistent': False,
+            'file': '',
+            'secret': '',
+        },
+        'reload': {
+            'check': 0,
+        },
+        'profiler': {
+            'enabled': False,
+            'token': '',
+            'max_duration': 30,
+            'interval': 0.005,
+        },
     }
 
     REQUIRED = [
         ['fairsharing', 'api'],
     ]
 
+    REQUIRED_PERSISTENT_TOKENS = [
+        ['tokens', 'file'],
+        ['tokens', 'secret'],
+    ]
+
+    REQUIRED_PROFILER = [
+        ['profiler', 'token'],
+    ]
+
     def __init__(self):
         self.cfg = dict()
 
@@ -103,8 +252,29 @@ class ProxyConfigParser:
         for path in self.REQUIRED:
             if not self.has(*path):
                 missing.append('.'.join(path))
+        if self.get_or_default('tokens', 'persistent'):
+            for path in self.REQUIRED_PERSISTENT_TOKENS:
+                if not self.get_or_default(*path):
+                    missing.append('.'.join(path))
+        if self.get_or_default('profiler', 'enabled'):
+            for path in self.REQUIRED_PROFILER:
+                if not self.get_or_default(*path):
+                    missing.append('.'.join(path))
         if len(missing) > 0:
             raise MissingConfigurationError(missing)
+        self._validate_admission()
+
+    def _validate_admission(self):
+        if not self.get_or_default('admission', 'enabled'):
+            return
+        # a full batch from a single client must not be rejected
+        per_client = int(self.get_or_default('admission', 'client_limit')) + \
+            int(self.get_or_default('admission', 'queue_limit'))
+        if per_client < BATCH_MAX_QUERIES:
+            raise InvalidConfigurationError(
+                f'admission.client_limit + admission.queue_limit must be at '
+                f'least {BATCH_MAX_QUERIES} (maximal batch size)'
+            )
 
     @property
     def _fairsharing(self):
@@ -130,9 +300,62 @@ class ProxyConfigParser:
             page_delay=float(self.get_or_default('cache', 'page_delay')),
             page_size=int(self.get_or_default('cache', 'page_size')),
             page_timeout=int(self.get_or_default('cache', 'page_timeout')),
+            serve_search=self.get_or_default('cache', 'serve_search'),
+            search_limit=int(self.get_or_default('cache', 'search_limit')),
+            snapshot_dir=self.get_or_default('cache', 'snapshot_dir'),
+            snapshot_check=float(self.get_or_default('cache', 'snapshot_check')),
+            readers=int(self.get_or_default('cache', 'readers')),
+            catalogue_dir=self.get_or_default('cache', 'catalogue_dir'),
+            conditional=self.get_or_default('cache', 'conditional'),
+        )
+
+    @property
+    def _results(self):
+        return ResultsConfig(
+            size=int(self.get_or_default('results', 'size')),
+            ttl=float(self.get_or_default('results', 'ttl')),
+            negative_ttl=float(self.get_or_default('results', 'negative_ttl')),
+            prewarm=int(self.get_or_default('results', 'prewarm')),
+            prewarm_delay=float(self.get_or_default('results', 'prewarm_delay')),
+            stats_flush=float(self.get_or_default('results', 'stats_flush')),
+            persistent=self.get_or_default('results', 'persistent'),
+            sweep=float(self.get_or_default('results', 'sweep')),
+        )
+
+    @property
+    def _admission(self):
+        return AdmissionConfig(
+            enabled=self.get_or_default('admission', 'enabled'),
+            global_limit=int(self.get_or_default('admission', 'global_limit')),
+            client_limit=int(self.get_or_default('admission', 'client_limit')),
+            queue_limit=int(self.get_or_default('admission', 'queue_limit')),
+        )
+
+    @property
+    def _tokens(self):
+        return TokensConfig(
+            persistent=self.get_or_default('tokens', 'persistent'),
+            filename=self.get_or_default('tokens', 'file'),
+            secret=self.get_or_default('tokens', 'secret'),
+        )
+
+    @property
+    def _reload(self):
+        return ReloadConfig(
+            check=float(self.get_or_default('reload', 'check')),
+        )
+
+    @property
+    def _profiler(self):
+        return ProfilerConfig(
+            enabled=self.get_or_default('profiler', 'enabled'),
+            token=self.get_or_default('profiler', 'token'),
+            max_duration=float(self.get_or_default('profiler', 'max_duration')),
+            interval=float(self.get_or_default('profiler', 'interval')),
         )
 
     def parse_file(self, fp) -> ProxyConfig:
+        import yaml
         self.cfg = yaml.full_load(fp)
         self.validate()
         return self.config
@@ -143,7 +366,39 @@ class ProxyConfigParser:
             fairsharing=self._fairsharing,
             logging=self._logging,
             cache=self._cache,
+            tokens=self._tokens,
+            results=self._results,
+            admission=self._admission,
+            reload=self._reload,
+            profiler=self._profiler,
         )
 
 
+class ConfigFileWatcher:
+    """Detects changes of config file and parses it again"""
+
+    def __init__(self, path: str):
+        self.path = pathlib.Path(path)
+        self._stamp = self._read_stamp()
+
+    def _read_stamp(self) -> Optional[tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        stamp = self._read_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+    def load(self) -> ProxyConfig:
+        # fresh parser, a failed reload must not affect the current one
+        with self.path.open() as fp:
+            return ProxyConfigParser().parse_file(fp)
+
+
 cfg_parser = ProxyConfigParser()
@@ -14,6 +14,13 @@ DEFAULT_CONFIG = '/app/config.yml'
 DEFAULT_LOG_LEVEL = 'INFO'
 DEFAULT_LOG_FORMAT = '%(asctime)s | %(levelname)s | %(module)s: %(message)s'
 
+BATCH_MAX_QUERIES = 25
+LOOKUP_MAX_IDENTIFIERS = 1000
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+CHANGES_DEFAULT_LIMIT = 100
+CHANGES_MAX_LIMIT = 1000
+
 INFO_TEXT = 'This service can be used only for integration with DSW. ' \
             'Any other use is strictly prohibited. All the data reachable ' \
             'through the proxy fall under the FAIRsharing license available ' \
@@ -1,18 +1,41 @@
+import asyncio
 import base64
+import contextlib
+import datetime
+import functools
+import hmac
 import httpx
 import os
-import pathlib
+import signal
 
 import fastapi
 
+from typing import AsyncIterator, Mapping, Optional, Union
+
+from fairsharing_proxy.admission import AdmissionController, \
+    AdmissionRejectedError
 from fairsharing_proxy.cache import RecordsCache
-from fairsharing_proxy.config import ProxyConfig, cfg_parser
-from fairsharing_proxy.consts import DEFAULT_CONFIG, ENV_CONFIG
+from fairsharing_proxy.catalogue import Catalogue, IDENTITY, GZIP, ZSTD
+from fairsharing_proxy.changes import Position, START, InvalidCursorError, \
+    decode_cursor, encode_cursor, parse_since
+from fairsharing_proxy.config import ConfigFileWatcher, ProxyConfig
+from fairsharing_proxy.consts import DEFAULT_CONFIG, ENV_CONFIG, \
+    BATCH_MAX_QUERIES, LOOKUP_MAX_IDENTIFIERS, \
+    AUTOCOMPLETE_DEFAULT_LIMIT, AUTOCOMPLETE_MAX_LIMIT, \
+    CHANGES_DEFAULT_LIMIT, CHANGES_MAX_LIMIT
 from fairsharing_proxy.api_client import FAIRSharingClient, \
     FAIRSharingUnauthorizedError
-from fairsharing_proxy.logger import LOG, init_config_logging
+from fairsharing_proxy.logger import LOG, init_config_logging, \
+    update_logging_level
 from fairsharing_proxy.model import Token, ProxyRequest, \
-    LegacySearchQuery, SearchQuery, RecordSet
+    LegacySearchQuery, SearchQuery, Record, RecordSet
+from fairsharing_proxy.profiler import SamplingProfiler, ProfilerBusyError
+from fairsharing_proxy.results import ResultCache, QueryStats, \
+    PersistentResultCache, CachedError, is_deterministic_error
+from fairsharing_proxy.search import can_search_locally
+from fairsharing_proxy.snapshot import encode_json
+from fairsharing_proxy.tokens import TokenStore, create_token_store
+from fairsharing_proxy.validators import QUERY, Validators, ValidatorStore
 
 
 class SearchRetryError(Exception):
@@ -23,42 +46,17 @@ def _as_message(msg: str) -> dict:
     return {'message': msg}
 
 
-def _load_config() -> ProxyConfig:
-    config_file = os.getenv(ENV_CONFIG, DEFAULT_CONFIG)
+def _load_config(watcher: ConfigFileWatcher) -> ProxyConfig:
     try:
-        with pathlib.Path(config_file).open() as fp:
-            cfg = cfg_parser.parse_file(fp=fp)
+        cfg = watcher.load()
     except Exception as e:
-        LOG.error(f'[CONFIG] Failed to load config: {config_file}')
+        LOG.error(f'[CONFIG] Failed to load config: {watcher.path}')
         LOG.debug(str(e))
         exit(1)
-    LOG.info(f'Loaded config: {config_file}')
+    LOG.info(f'Loaded config: {watcher.path}')
     return cfg
 
 
-class TokenStore:
-
-    def __init__(self):
-        self._tokens = dict()  # type: dict[str, Token]
-
-    def has_token(self, username: str) -> bool:
-        return username in self._tokens
-
-    def get_token(self, username: str) -> Token:
-        return self._tokens[username]
-
-    def clear_token(self, username: str):
-        self._tokens.pop(username)
-
-    def has_usable_token(self, username: str) -> bool:
-        if not self.has_token(username):
-            return False
-        return not self.get_token(username).should_refresh
-
-    def store_token(self, username: str, token: Token):
-        self._tokens[username] = token
-
-
 class _ProxyCore:
 
     _instance = None
@@ -72,10 +70,108 @@ class _ProxyCore:
             return cls._instance
 
     def __init__(self):
-        self.cfg = _load_config()  # type: ProxyConfig
-        self.cache = RecordsCache(cfg=self.cfg)
-        self.client = FAIRSharingClient(cfg=self.cfg)
-        self.token_store = TokenStore()
+        # components are created on first use (at the latest in startup),
+        # importing the module must stay cheap and must not need config
+        self._tasks = []  # type: list[asyncio.Task]
+
+    @functools.cached_property
+    def config_watcher(self) -> ConfigFileWatcher:
+        return ConfigFileWatcher(os.getenv(ENV_CONFIG, DEFAULT_CONFIG))
+
+    @functools.cached_property
+    def cfg(self) -> ProxyConfig:
+        return _load_config(self.config_watcher)
+
+    @functools.cached_property
+    def cache(self) -> RecordsCache:
+        return RecordsCache(cfg=self.cfg)
+
+    @functools.cached_property
+    def client(self) -> FAIRSharingClient:
+        return FAIRSharingClient(cfg=self.cfg)
+
+    @functools.cached_property
+    def token_store(self) -> TokenStore:
+        cache_db = self.cache.db if self.cfg.cache.enabled else None
+        return create_token_store(cfg=self.cfg, cache_db=cache_db)
+
+    @functools.cached_property
+    def results(self) -> ResultCache[RecordSet]:
+        return ResultCache(
+            size=self.cfg.results.size,
+            ttl=self.cfg.results.ttl,
+        )
+
+    @functools.cached_property
+    def negative_results(self) -> ResultCache[Union[RecordSet, CachedError]]:
+        # empty results and deterministic upstream errors
+        return ResultCache(
+            size=self.cfg.results.size,
+            ttl=self.cfg.results.negative_ttl,
+        )
+
+    @functools.cached_property
+    def persistent_results(self) -> Optional[PersistentResultCache]:
+        if not (self.cfg.cache.enabled and self.cfg.results.persistent):
+            return None
+        return PersistentResultCache(db=self.cache.db)
+
+    @functools.cached_property
+    def query_stats(self) -> QueryStats:
+        return QueryStats(db=self.cache.db)
+
+    @functools.cached_property
+    def admission(self) -> Optional[AdmissionController]:
+        return self._configure_admission(None, self.cfg)
+
+    @staticmethod
+    def _configure_admission(admission: Optional[AdmissionController],
+                             cfg: ProxyConfig) -> Optional[AdmissionController]:
+        # requests holding a slot release it to the controller they got
+        if not cfg.admission.enabled:
+            return None
+        if admission is None:
+            return AdmissionController(
+                global_limit=cfg.admission.global_limit,
+                client_limit=cfg.admission.client_limit,
+                queue_limit=cfg.admission.queue_limit,
+            )
+        admission.configure(
+            global_limit=cfg.admission.global_limit,
+            client_limit=cfg.admission.client_limit,
+            queue_limit=cfg.admission.queue_limit,
+        )
+        return admission
+
+    @functools.cached_property
+    def profiler(self) -> SamplingProfiler:
+        return SamplingProfiler()
+
+    def _apply_config(self, cfg: ProxyConfig):
+        # no awaiting here, requests see either old or new settings
+        self.results.configure(size=cfg.results.size, ttl=cfg.results.ttl)
+        self.negative_results.configure(
+            size=cfg.results.size,
+            ttl=cfg.results.negative_ttl,
+        )
+        self.client.timeout = cfg.fairsharing.timeout
+        self.cache.config = cfg
+        self.admission = self._configure_admission(self.admission, cfg)
+        update_logging_level(cfg=cfg)
+        self.cfg = cfg
+
+    async def reload_config(self) -> bool:
+        try:
+            cfg = await asyncio.to_thread(self.config_watcher.load)
+        except Exception as e:
+            LOG.warning(f'[CONFIG] Invalid config, keeping the current one: '
+                        f'{type(e).__name__}: {str(e)}')
+            return False
+        for setting in cfg.retain_static(previous=self.cfg):
+            LOG.warning(f'[CONFIG] Change of {setting} requires restart, ignored')
+        self._apply_config(cfg)
+        LOG.info(f'[CONFIG] Reloaded config: {self.config_watcher.path}')
+        return True
 
     @staticmethod
     def _extract_credentials(rq: ProxyRequest, auth_str: str) -> tuple[str, str]:
@@ -93,7 +189,8 @@ class _ProxyCore:
 
     async def _get_token(self, rq: ProxyRequest, auth_str: str) -> Token:
         username, password = self._extract_credentials(rq, auth_str)
-        if self.token_store.has_usable_token(username):
+        rq.client_id = username
+        if await self.token_store.has_usable_token(username):
             return self.token_store.get_token(username)
         try:
             token = await self.client.login(username, password)
@@ -104,7 +201,7 @@ class _ProxyCore:
                         'Could not authenticate via remote API: {token.message}'
                     ),
                 )
-            self.token_store.store_token(username, token)
+            await self.token_store.store_token(username, token)
             return token
         except Exception as e:
             LOG.warning(f'[RQ:{rq.trace_id}] Failed to login: {str(e)}')
@@ -113,17 +210,59 @@ class _ProxyCore:
                 detail=_as_message('Failed to login via remote API.'),
             )
 
+    def _serves_locally(self, query: SearchQuery) -> bool:
+        return self.cfg.cache.serve_search and self.cache.is_loaded and \
+            can_search_locally(query)
+
     async def _execute_search(
             self, query: SearchQuery, token: Token, retry=False,
+            client: Optional[httpx.AsyncClient] = None, client_id='',
     ) -> RecordSet:
-        # TODO: cache
-        try:
-            results = await self.client.search(
+        if self._serves_locally(query):
+            return RecordSet(self.cache.search.search(
+                query=query,
+                limit=self.cfg.cache.search_limit,
+            ))
+        cached = await self._get_cached(query.cache_key)
+        if cached is not None:
+            return cached
+        async with self._admit(client_id):
+            result_set = await self._execute_upstream_search(
                 query=query,
                 token=token,
+                retry=retry,
+                client=client,
+                client_id=client_id,
+            )
+        self._store_result(query.cache_key, result_set)
+        return result_set
+
+    @contextlib.asynccontextmanager
+    async def _admit(self, client_id: str) -> AsyncIterator[None]:
+        if self.admission is None:
+            yield
+            return
+        try:
+            async with self.admission.slot(client_id):
+                yield
+        except AdmissionRejectedError as e:
+            LOG.info(f'[ADMISSION] Rejected request of {client_id} '
+                     f'(retry after {e.retry_after}s)')
+            raise fastapi.HTTPException(
+                status_code=429,
+                detail=_as_message('Too many concurrent requests.'),
+                headers={'Retry-After': str(e.retry_after)},
             )
+
+    async def _execute_upstream_search(
+            self, query: SearchQuery, token: Token, retry: bool,
+            client: Optional[httpx.AsyncClient], client_id: str,
+    ) -> RecordSet:
+        try:
+            results = await self._search_upstream(query, token, client)
         except FAIRSharingUnauthorizedError as e:
-            self.token_store.clear_token(token.username)
+            # stored under the login username (may differ from token.username)
+            await self.token_store.clear_token(client_id)
             if retry:
                 raise SearchRetryError()
             else:
@@ -132,6 +271,11 @@ class _ProxyCore:
                     detail=e.CONTENT,
                 )
         except httpx.HTTPStatusError as e:
+            if is_deterministic_error(e.response.status_code):
+                self._store_result(query.cache_key, CachedError(
+                    status_code=e.response.status_code,
+                    detail=e.response.text,
+                ))
             raise fastapi.HTTPException(
                 status_code=e.response.status_code,
                 detail=e.response.text,
@@ -149,6 +293,114 @@ class _ProxyCore:
         result_set.rectify()
         return result_set
 
+    @property
+    def _validators(self) -> Optional[ValidatorStore]:
+        if not (self.cfg.cache.enabled and self.cfg.cache.conditional):
+            return None
+        return self.cache.validators
+
+    async def _get_validators(
+            self, key: str,
+    ) -> tuple[Optional[Validators], list[Record]]:
+        """Validators of the last response and its records (if all cached)"""
+        if self._validators is None:
+            return None, []
+        try:
+            known = await self._validators.get(QUERY, key)
+            if known is None:
+                return None, []
+            records = await self._validators.find_records(known.ids)
+        except Exception as e:
+            LOG.warning(f'[RESULTS] Failed to read validators: {str(e)}')
+            return None, []
+        if records is None:
+            return None, []
+        return known, records
+
+    async def _put_validators(self, key: str, validators: Validators):
+        if self._validators is None:
+            return
+        try:
+            await self._validators.put(QUERY, key, validators)
+        except Exception as e:
+            LOG.warning(f'[RESULTS] Failed to store validators: {str(e)}')
+
+    async def _search_upstream(
+            self, query: SearchQuery, token: Token,
+            client: Optional[httpx.AsyncClient],
+    ) -> list[Record]:
+        # expired result is revalidated if its records are still cached
+        key = query.cache_key
+        known, records = await self._get_validators(key)
+        if client is None:
+            result = await self.client.search_conditional(query, token, known)
+        else:
+            result = await self.client.client_search_conditional(
+                client=client,
+                query=query,
+                token=token,
+                known=known,
+            )
+        self._start_task(self._put_validators(key, result.validators))
+        if result.records is None:
+            LOG.debug(f'[RESULTS] Not modified: {key}')
+            return records
+        return result.records
+
+    def _store_result(self, key: str, value: Union[RecordSet, CachedError],
+                      ttl: Optional[float] = None, persist=True):
+        if isinstance(value, RecordSet) and len(value.records) > 0:
+            self.results.put(key, value, ttl=ttl)
+            persistent_ttl = self.cfg.results.ttl
+        else:
+            self.negative_results.put(key, value, ttl=ttl)
+            persistent_ttl = self.cfg.results.negative_ttl
+        if persist and self.persistent_results is not None:
+            self._start_task(self._persist_result(key, value, persistent_ttl))
+
+    async def _persist_result(self, key: str,
+                              value: Union[RecordSet, CachedError], ttl: float):
+        if self.persistent_results is None:
+            return
+        try:
+            await self.persistent_results.put(key=key, value=value, ttl=ttl)
+        except Exception as e:
+            LOG.warning(f'[RESULTS] Failed to store persistent result: {str(e)}')
+
+    async def _get_persistent(
+            self, key: str,
+    ) -> Optional[Union[RecordSet, CachedError]]:
+        if self.persistent_results is None:
+            return None
+        try:
+            entry = await self.persistent_results.get(key)
+        except Exception as e:
+            LOG.warning(f'[RESULTS] Failed to read persistent result: {str(e)}')
+            return None
+        if entry is None:
+            return None
+        value, ttl = entry
+        self._store_result(key, value, ttl=ttl, persist=False)
+        return value
+
+    async def _get_cached(self, key: str) -> Optional[RecordSet]:
+        cached = self.results.get(key)
+        if cached is not None:
+            return cached
+        other = self.negative_results.get(key)
+        if other is None:
+            other = await self._get_persistent(key)
+        if isinstance(other, CachedError):
+            raise fastapi.HTTPException(
+                status_code=other.status_code,
+                detail=other.detail,
+            )
+        return other
+
+    def _record_query(self, query: SearchQuery):
+        if self.cfg.cache.enabled:
+            self.query_stats.record(query)
+
     async def legacy_search(
             self, request: fastapi.Request,
     ) -> fastapi.Response:
@@ -156,19 +408,21 @@ class _ProxyCore:
         head_auth = rq.headers.get('Api-Key', '')
         token = await self._get_token(rq, head_auth)
         query = LegacySearchQuery.from_params(params=request.query_params)
+        self._record_query(query.to_query())
         try:
             result_set = await self._execute_search(
                 query=query.to_query(),
                 token=token,
                 retry=True,
+                client_id=rq.client_id,
             )
         except SearchRetryError:
-            self.token_store.clear_token(head_auth)
             token = await self._get_token(rq, head_auth)
             result_set = await self._execute_search(
                 query=query.to_query(),
                 token=token,
                 retry=False,
+                client_id=rq.client_id,
             )
         return fastapi.responses.JSONResponse(
             status_code=200,
@@ -178,38 +432,491 @@ class _ProxyCore:
     async def search(
             self, request: fastapi.Request, is_get: bool,
     ) -> fastapi.Response:
-        # TODO: cache
         rq = ProxyRequest(request=request)
         head_auth = rq.headers.get('Authorization', '')
         token = await self._get_token(rq, head_auth)
         if is_get:
             query = SearchQuery.from_params(params=request.query_params)
         else:
-            query = SearchQuery.from_json(data=request.json())
+            query = SearchQuery.from_json(data=await request.json())
+        self._record_query(query)
         try:
             result_set = await self._execute_search(
                 query=query,
                 token=token,
                 retry=True,
+                client_id=rq.client_id,
             )
         except SearchRetryError:
-            self.token_store.clear_token(head_auth)
             token = await self._get_token(rq, head_auth)
             result_set = await self._execute_search(
-                query=query.to_query(),
+                query=query,
                 token=token,
                 retry=False,
+                client_id=rq.client_id,
             )
         return fastapi.responses.JSONResponse(
             status_code=200,
             content=result_set.to_json(),
         )
 
+    @staticmethod
+    async def _extract_batch(
+            rq: ProxyRequest, request: fastapi.Request,
+    ) -> list[SearchQuery]:
+        try:
+            data = await request.json()
+        except Exception as e:
+            LOG.warning(f'[RQ:{rq.trace_id}] Invalid batch payload: {str(e)}')
+            data = None
+        if not isinstance(data, list):
+            raise fastapi.HTTPException(
+                status_code=400,
+                detail=_as_message('Batch must be a list of search queries.'),
+            )
+        if len(data) > BATCH_MAX_QUERIES:
+            raise fastapi.HTTPException(
+                status_code=400,
+                detail=_as_message(
+                    f'Batch can contain at most {BATCH_MAX_QUERIES} queries.'
+                ),
+            )
+        return [SearchQuery.from_json(data=item) for item in data]
+
+    async def _execute_batch(
+            self, queries: list[SearchQuery], token: Token, retry=False,
+            client_id='',
+    ) -> list[Union[RecordSet, fastapi.HTTPException]]:
+        async with httpx.AsyncClient() as client:
+            # all queries finish before the client is closed
+            results = await asyncio.gather(*(
+                self._execute_search(
+                    query=query,
+                    token=token,
+                    retry=retry,
+                    client=client,
+                    client_id=client_id,
+                ) for query in queries
+            ), return_exceptions=True)
+        checked = []  # type: list[Union[RecordSet, fastapi.HTTPException]]
+        for result in results:
+            # e.g. SearchRetryError, the whole batch is retried
+            if not isinstance(result, (RecordSet, fastapi.HTTPException)):
+                raise result
+            checked.append(result)
+        return checked
+
+    @staticmethod
+    def _batch_entry(result: Union[RecordSet, fastapi.HTTPException]) -> dict:
+        if isinstance(result, RecordSet):
+            return result.to_json()
+        return {
+            'error': {
+                'status_code': result.status_code,
+                'detail': result.detail,
+            },
+        }
+
+    async def search_batch(
+            self, request: fastapi.Request,
+    ) -> fastapi.Response:
+        rq = ProxyRequest(request=request)
+        head_auth = rq.headers.get('Authorization', '')
+        queries = await self._extract_batch(rq, request)
+        token = await self._get_token(rq, head_auth)
+        for query in queries:
+            self._record_query(query)
+        try:
+            result_sets = await self._execute_batch(
+                queries=queries,
+                token=token,
+                retry=True,
+                client_id=rq.client_id,
+            )
+        except SearchRetryError:
+            token = await self._get_token(rq, head_auth)
+            result_sets = await self._execute_batch(
+                queries=queries,
+                token=token,
+                retry=False,
+                client_id=rq.client_id,
+            )
+        return fastapi.responses.JSONResponse(
+            status_code=200,
+            content={
+                'results': [self._batch_entry(rs) for rs in result_sets],
+            },
+        )
+
+    def _require_cache(self):
+        if not self.cache.is_loaded:
+            raise fastapi.HTTPException(
+                status_code=503,
+                detail=_as_message('Local cache of records is not available.'),
+            )
+
+    async def get_record(
+            self, request: fastapi.Request, identifier: str,
+    ) -> fastapi.Response:
+        rq = ProxyRequest(request=request)
+        head_auth = rq.headers.get('Authorization', '')
+        await self._get_token(rq, head_auth)
+        self._require_cache()
+        encoded = self.cache.find_encoded(identifier)
+        if encoded is None:
+            raise fastapi.HTTPException(
+                status_code=404,
+                detail=_as_message(f'Record not found: {identifier}'),
+            )
+        return fastapi.responses.Response(
+            status_code=200,
+            content=encoded,
+            media_type='application/json',
+        )
+
+    @staticmethod
+    async def _extract_identifiers(
+            rq: ProxyRequest, request: fastapi.Request,
+    ) -> list[str]:
+        try:
+            data = await request.json()
+        except Exception as e:
+            LOG.warning(f'[RQ:{rq.trace_id}] Invalid lookup payload: {str(e)}')
+            data = None
+        if not isinstance(data, list) or \
+                not all(isinstance(item, str) for item in data):
+            raise fastapi.HTTPException(
+                status_code=400,
+                detail=_as_message('Lookup must be a list of identifiers.'),
+            )
+        if len(data) > LOOKUP_MAX_IDENTIFIERS:
+            raise fastapi.HTTPException(
+                status_code=400,
+                detail=_as_message(
+                    f'Lookup can contain at most {LOOKUP_MAX_IDENTIFIERS} '
+                    f'identifiers.'
+                ),
+            )
+        return data
+
+    async def lookup_records(
+            self, request: fastapi.Request,
+    ) -> fastapi.Response:
+        rq = ProxyRequest(request=request)
+        head_auth = rq.headers.get('Authorization', '')
+        identifiers = await self._extract_identifiers(rq, request)
+        await self._get_token(rq, head_auth)
+        self._require_cache()
+        results = b','.join(
+            self.cache.find_encoded(identifier) or b'null'
+            for identifier in identifiers
+        )
+        return fastapi.responses.Response(
+            status_code=200,
+            content=b'{"results":[' + results + b'],"note":' +
+                    encode_json(RecordSet.NOTE) + b'}',
+            media_type='application/json',
+        )
+
+    @staticmethod
+    def _extract_limit(rq: ProxyRequest, params: Mapping,
+                       default: int, maximum: int) -> int:
+        try:
+            limit = int(params.get('limit', default))
+        except ValueError as e:
+            LOG.warning(f'[RQ:{rq.trace_id}] Invalid limit: {str(e)}')
+            raise fastapi.HTTPException(
+                status_code=400,
+                detail=_as_message('Limit must be an integer.'),
+            )
+        return max(0, min(limit, maximum))
+
+    async def autocomplete(
+            self, request: fastapi.Request,
+    ) -> fastapi.Response:
+        rq = ProxyRequest(request=request)
+        head_auth = rq.headers.get('Authorization', '')
+        params = request.query_params
+        limit = self._extract_limit(rq, params, AUTOCOMPLETE_DEFAULT_LIMIT,
+                                    AUTOCOMPLETE_MAX_LIMIT)
+        await self._get_token(rq, head_auth)
+        self._require_cache()
+        records = self.cache.prefixes.suggest(
+            prefix=params.get('q', ''),
+            limit=limit,
+            registry=params.get('registry', None),
+            record_type=params.get('record_type', None),
+        )
+        return fastapi.responses.JSONResponse(
+            status_code=200,
+            content={
+                'data': [record.to_suggestion_json() for record in records],
+                'note': RecordSet.NOTE,
+            },
+        )
+
+    @staticmethod
+    def _select_encoding(catalogue: Catalogue, accept_encoding: str) -> str:
+        accepted = set()
+        for part in accept_encoding.lower().split(','):
+            name, _, params = part.partition(';')
+            if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00'):
+                continue
+            accepted.add(name.strip())
+        for encoding in (ZSTD, GZIP):
+            if encoding in catalogue.files and \
+                    (encoding in accepted or '*' in accepted):
+                return encoding
+        return IDENTITY
+
+    async def get_catalogue(
+            self, request: fastapi.Request,
+    ) -> fastapi.Response:
+        rq = ProxyRequest(request=request)
+        head_auth = rq.headers.get('Authorization', '')
+        await self._get_token(rq, head_auth)
+        self._require_cache()
+        if self.cache.catalogues is not None:
+            # the CLI or other workers may have published a newer one
+            # (and removed the files of older ones)
+            await asyncio.to_thread(self.cache.catalogues.refresh)
+        catalogue = self.cache.catalogue
+        if catalogue is None:
+            raise fastapi.HTTPException(
+                status_code=404,
+                detail=_as_message('Catalogue download is not available.'),
+            )
+        encoding = self._select_encoding(
+            catalogue, rq.headers.get('Accept-Encoding', ''),
+        )
+        headers = {
+            'ETag': catalogue.etag(encoding),
+            'Vary': 'Accept-Encoding',
+        }
+        if catalogue.matches(rq.headers.get('If-None-Match', '')):
+            return fastapi.responses.Response(status_code=304, headers=headers)
+        path = catalogue.path(encoding)
+        if not path.is_file():
+            LOG.warning(f'[RQ:{rq.trace_id}] Catalogue file {path.name} is missing')
+            raise fastapi.HTTPException(
+                status_code=503,
+                detail=_as_message('Catalogue is being updated, try again later.'),
+                headers={'Retry-After': '1'},
+            )
+        if encoding != IDENTITY:
+            headers['Content-Encoding'] = encoding
+        return fastapi.responses.FileResponse(
+            path=path,
+            media_type='application/json',
+            headers=headers,
+        )
+
+    @staticmethod
+    def _extract_position(rq: ProxyRequest,
+                          params: Mapping) -> tuple[Position, str]:
+        """Feed position from cursor and local time filter from since"""
+        try:
+            position = decode_cursor(params['cursor']) \
+                if 'cursor' in params else START
+            since = parse_since(params['since']) if 'since' in params else ''
+        except InvalidCursorError as e:
+            LOG.warning(f'[RQ:{rq.trace_id}] {str(e)}')
+            raise fastapi.HTTPException(
+                status_code=400,
+                detail=_as_message(str(e)),
+            )
+        return position, since
+
+    async def changes(
+            self, request: fastapi.Request,
+    ) -> fastapi.Response:
+        rq = ProxyRequest(request=request)
+        head_auth = rq.headers.get('Authorization', '')
+        params = request.query_params
+        limit = self._extract_limit(rq, params, CHANGES_DEFAULT_LIMIT,
+                                    CHANGES_MAX_LIMIT)
+        position, since = self._extract_position(rq, params)
+        await self._get_token(rq, head_auth)
+        self._require_cache()
+        changes, has_more = await self.cache.changes(
+            after=position,
+            since=since,
+            limit=max(1, limit),
+        )
+        if len(changes) > 0:
+            position = changes[-1].position
+        return fastapi.responses.JSONResponse(
+            status_code=200,
+            content={
+                'data': [change.to_json() for change in changes],
+                'next_cursor': encode_cursor(position),
+                'has_more': has_more,
+                'note': RecordSet.NOTE,
+            },
+        )
+
+    def _check_admin(self, rq: ProxyRequest):
+        if not self.cfg.profiler.enabled:
+            raise fastapi.HTTPException(
+                status_code=404,
+                detail=_as_message('Not Found'),
+            )
+        token = rq.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode('utf-8'),
+                                   self.cfg.profiler.token.encode('utf-8')):
+            LOG.warning(f'[RQ:{rq.trace_id}] Invalid admin token')
+            raise fastapi.HTTPException(
+                status_code=403,
+                detail=_as_message('Invalid admin token.'),
+            )
+
+    async def profile(
+            self, request: fastapi.Request,
+    ) -> fastapi.Response:
+        rq = ProxyRequest(request=request)
+        self._check_admin(rq)
+        try:
+            duration = float(request.query_params.get('duration', 5))
+        except ValueError:
+            raise fastapi.HTTPException(
+                status_code=400,
+                detail=_as_message('Duration must be a number.'),
+            )
+        duration = max(0.1, min(duration, self.cfg.profiler.max_duration))
+        LOG.info(f'[PROFILER] Profiling for {duration}s')
+        try:
+            result = await asyncio.to_thread(
+                self.profiler.run, duration, self.cfg.profiler.interval,
+            )
+        except ProfilerBusyError:
+            raise fastapi.HTTPException(
+                status_code=409,
+                detail=_as_message('Profiling is already in progress.'),
+            )
+        now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        return fastapi.responses.PlainTextResponse(
+            status_code=200,
+            content=result,
+            headers={
+                'Content-Disposition':
+                    f'attachment; filename="profile-{now}.collapsed"',
+            },
+        )
+
+    async def _prewarm(self):
+        limit = self.cfg.results.prewarm
+        if limit <= 0 or not self.cfg.cache.username:
+            return
+        queries = [q for q in await self.query_stats.top(limit)
+                   if not self._serves_locally(q) and
+                   q.cache_key not in self.results and
+                   q.cache_key not in self.negative_results]
+        if len(queries) == 0:
+            return
+        LOG.info(f'[RESULTS] Prewarming {len(queries)} popular queries')
+        token = await self.client.login(
+            username=self.cfg.cache.username,
+            password=self.cfg.cache.password,
+        )
+        for query in queries:
+            try:
+                await self._execute_search(
+                    query=query,
+                    token=token,
+                    client_id=self.cfg.cache.username,
+                )
+            except Exception as e:
+                LOG.debug(f'[RESULTS] Prewarm query failed: {str(e)}')
+            await asyncio.sleep(self.cfg.results.prewarm_delay)
+        LOG.info('[RESULTS] Prewarming done')
+
+    async def _run_prewarm(self):
+        try:
+            await self._prewarm()
+        except Exception as e:
+            LOG.warning(f'[RESULTS] Prewarming failed: {str(e)}')
+
+    async def _flush_query_stats(self):
+        while True:
+            await asyncio.sleep(self.cfg.results.stats_flush)
+            try:
+                await self.query_stats.flush()
+            except Exception as e:
+                LOG.warning(f'[RESULTS] Failed to store query stats: {str(e)}')
+
+    async def _sweep_results(self):
+        while True:
+            await asyncio.sleep(self.cfg.results.sweep)
+            try:
+                if self.persistent_results is not None:
+                    removed = await self.persistent_results.sweep()
+                    LOG.debug(f'[RESULTS] Removed {removed} expired persistent '
+                              f'results')
+                removed = await self.cache.validators.sweep()
+                LOG.debug(f'[RESULTS] Removed {removed} old validators')
+            except Exception as e:
+                LOG.warning(f'[RESULTS] Failed to remove expired results: {str(e)}')
+
+    async def _watch_snapshots(self):
+        # other processes (crawl, other workers) may publish new snapshot
+        while True:
+            await asyncio.sleep(self.cfg.cache.snapshot_check)
+            try:
+                if await self.cache.load_snapshot():
+                    self._start_task(self._run_prewarm())
+            except Exception as e:
+                LOG.warning(f'[SNAPSHOT] Failed to reload snapshot: {str(e)}')
+
+    def _start_task(self, coro):
+        self._tasks = [task for task in self._tasks if not task.done()]
+        self._tasks.append(asyncio.create_task(coro))
+
+    async def _watch_config(self):
+        while True:
+            await asyncio.sleep(self.cfg.reload.check)
+            if self.config_watcher.changed():
+                await self.reload_config()
+
+    def _handle_sighup(self):
+        LOG.info('[CONFIG] Received SIGHUP, reloading config')
+        self._start_task(self.reload_config())
+
+    def _set_sighup_handler(self, enabled: bool):
+        # not available on Windows nor outside of the main thread
+        try:
+            loop = asyncio.get_running_loop()
+            if enabled:
+                loop.add_signal_handler(signal.SIGHUP, self._handle_sighup)
+            else:
+                loop.remove_signal_handler(signal.SIGHUP)
+        except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+            pass
+
     async def startup(self):
         init_config_logging(cfg=self.cfg)
+        # create request-path components now instead of on first request
+        _ = self.client, self.token_store, self.results, self.admission
+        await self.token_store.prepare()
+        self._set_sighup_handler(enabled=True)
+        if self.cfg.reload.check > 0:
+            self._start_task(self._watch_config())
+        if self.cfg.cache.enabled:
+            await self.cache.prepare()
+            await self.cache.load()
+            if self.cache.snapshots is not None:
+                self._start_task(self._watch_snapshots())
+            self._start_task(self._flush_query_stats())
+            self._start_task(self._sweep_results())
+            self._start_task(self._run_prewarm())
 
     async def shutdown(self):
-        self.cache.finalize()
+        self._set_sighup_handler(enabled=False)
+        for task in self._tasks:
+            task.cancel()
+        if self.cfg.cache.enabled:
+            await self.query_stats.flush()
+        await self.token_store.close()
+        await self.cache.finalize()
 
 
 CORE = _ProxyCore()
@@ -0,0 +1,78 @@
+import asyncio
+import concurrent.futures
+import functools
+import sqlite3
+import threading
+
+from typing import Any, Callable, TypeVar
+
+T = TypeVar('T')
+
+
+class Database:
+    """SQLite accessed from worker threads: a pool of readers, one writer"""
+
+    def __init__(self, filename: str, readers: int = 2):
+        self.filename = filename
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []  # type: list[sqlite3.Connection]
+        self._writer = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='cache-writer',
+        )
+        self._readers = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, readers),
+            thread_name_prefix='cache-reader',
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # each connection is used by its thread only, check_same_thread
+            # is relaxed just to be able to close them on shutdown
+            connection = sqlite3.connect(
+                database=self.filename,
+                timeout=30,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL;')
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _call(self, func: Callable[..., T], *args: Any) -> T:
+        return func(self._connection(), *args)
+
+    def _call_commit(self, func: Callable[..., T], *args: Any) -> T:
+        connection = self._connection()
+        try:
+            result = func(connection, *args)
+            connection.commit()
+            return result
+        except Exception:
+            connection.rollback()
+            raise
+
+    async def read(self, func: Callable[..., T], *args: Any) -> T:
+        """Run func(connection, *args) in a reader thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._readers, functools.partial(self._call, func, *args),
+        )
+
+    async def write(self, func: Callable[..., T], *args: Any) -> T:
+        """Run func(connection, *args) in the writer thread and commit"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer, functools.partial(self._call_commit, func, *args),
+        )
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
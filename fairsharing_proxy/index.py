@@ -0,0 +1,176 @@
+import array
+import bisect
+import unicodedata
+
+from typing import Optional, Sequence
+
+from fairsharing_proxy.arrays import REF, EncodedSections, Numbers, Sections, \
+    Strings, load_numbers, load_strings, pack_numbers, pack_strings
+from fairsharing_proxy.consts import URL_PREFIX, URL_PREFIX_LEN
+from fairsharing_proxy.model import Record
+
+_DOI_PREFIXES = ('https://doi.org/', 'http://doi.org/', 'doi:')
+
+
+def normalize_text(text: str) -> str:
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.split())
+
+
+def _normalize(identifier: str) -> str:
+    return identifier.strip().lower()
+
+
+def _normalize_doi(doi: str) -> str:
+    doi = _normalize(doi)
+    for prefix in _DOI_PREFIXES:
+        if doi.startswith(prefix):
+            return doi[len(prefix):]
+    return doi
+
+
+def _normalize_slug(slug: str) -> str:
+    slug = _normalize(slug)
+    if slug.startswith(URL_PREFIX):
+        slug = slug[URL_PREFIX_LEN:]
+    return slug.strip('/')
+
+
+class RecordLookupIndex:
+
+    def __init__(self):
+        self.by_id = dict()  # type: dict[str, Record]
+        self.by_doi = dict()  # type: dict[str, Record]
+        self.by_legacy_id = dict()  # type: dict[str, Record]
+        self.by_slug = dict()  # type: dict[str, Record]
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def build(self, records: list[Record]):
+        by_id = dict()  # type: dict[str, Record]
+        by_doi = dict()  # type: dict[str, Record]
+        by_legacy_id = dict()  # type: dict[str, Record]
+        by_slug = dict()  # type: dict[str, Record]
+        for record in records:
+            by_id[_normalize(record.fairsharing_id)] = record
+            if record.doi:
+                by_doi[_normalize_doi(record.doi)] = record
+            for legacy_id in record.legacy_ids:
+                by_legacy_id[_normalize(legacy_id)] = record
+            if record.url.startswith(URL_PREFIX):
+                by_slug[_normalize_slug(record.url)] = record
+        # swap at once so that lookups never see partially built index
+        self.by_id, self.by_doi, self.by_legacy_id, self.by_slug = \
+            by_id, by_doi, by_legacy_id, by_slug
+
+    @staticmethod
+    def candidate_keys(identifier: str) -> list[tuple[str, str]]:
+        """Normalized keys of all identifier kinds in order of precedence"""
+        key = _normalize(identifier)
+        return [
+            ('i', key),
+            ('d', _normalize_doi(key)),
+            ('l', key),
+            ('s', _normalize_slug(key)),
+        ]
+
+    def find(self, identifier: str) -> Optional[Record]:
+        indexes = (self.by_id, self.by_doi, self.by_legacy_id, self.by_slug)
+        for index, (_, key) in zip(indexes, self.candidate_keys(identifier)):
+            record = index.get(key, None)
+            if record is not None:
+                return record
+        return None
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self.records = []  # type: Sequence[Record]
+        self.registries = []  # type: Strings
+        self.record_types = []  # type: Strings
+        # (1) whole names and abbreviations, (2) inner words of names
+        self.primary = ([], array.array(REF))  # type: tuple[Strings, Numbers]
+        self.secondary = ([], array.array(REF))  # type: tuple[Strings, Numbers]
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def _sorted(entries: list[tuple[str, int]]) -> tuple[Strings, Numbers]:
+        entries.sort()
+        return [key for key, _ in entries], array.array(REF, (r for _, r in entries))
+
+    def build(self, records: list[Record]):
+        primary = []  # type: list[tuple[str, int]]
+        secondary = []  # type: list[tuple[str, int]]
+        for ref, record in enumerate(records):
+            name = normalize_text(record.name)
+            abbreviation = normalize_text(record.abbreviation)
+            if name:
+                primary.append((name, ref))
+            if abbreviation and abbreviation != name:
+                primary.append((abbreviation, ref))
+            words = name.split(' ')
+            for i in range(1, len(words)):
+                secondary.append((' '.join(words[i:]), ref))
+        self.primary = self._sorted(primary)
+        self.secondary = self._sorted(secondary)
+        self.registries = [record.registry for record in records]
+        self.record_types = [record.record_type for record in records]
+        self.records = records
+
+    def to_sections(self, prefix: str) -> EncodedSections:
+        sections = dict()  # type: EncodedSections
+        for name, (keys, refs) in (('primary', self.primary),
+                                   ('secondary', self.secondary)):
+            sections.update(pack_strings(f'{prefix}.{name}', keys))
+            sections.update(pack_numbers(f'{prefix}.{name}.refs', REF, refs))
+        sections.update(pack_strings(f'{prefix}.registries', self.registries))
+        sections.update(pack_strings(f'{prefix}.record_types', self.record_types))
+        return sections
+
+    def load_sections(self, sections: Sections, prefix: str,
+                      records: Sequence[Record]):
+        """Use index mapped from a snapshot (records are decoded on access)"""
+        self.primary = (load_strings(sections, f'{prefix}.primary'),
+                        load_numbers(sections, f'{prefix}.primary.refs', REF))
+        self.secondary = (load_strings(sections, f'{prefix}.secondary'),
+                          load_numbers(sections, f'{prefix}.secondary.refs', REF))
+        self.registries = load_strings(sections, f'{prefix}.registries')
+        self.record_types = load_strings(sections, f'{prefix}.record_types')
+        self.records = records
+
+    def _matches(self, ref: int, registry: Optional[str],
+                 record_type: Optional[str]) -> bool:
+        if registry is not None and self.registries[ref] != registry:
+            return False
+        if record_type is not None and self.record_types[ref] != record_type:
+            return False
+        return True
+
+    def suggest(self, prefix: str, limit: int = 10,
+                registry: Optional[str] = None,
+                record_type: Optional[str] = None) -> list[Record]:
+        prefix = normalize_text(prefix)
+        if not prefix or limit <= 0:
+            return []
+        registry = registry.lower() if registry else None
+        record_type = record_type.lower() if record_type else None
+        seen = set()  # type: set[int]
+        result = []  # type: list[Record]
+        for keys, refs in (self.primary, self.secondary):
+            i = bisect.bisect_left(keys, prefix)  # type: ignore
+            while i < len(keys) and keys[i].startswith(prefix):
+                ref = refs[i]
+                i += 1
+                if ref in seen:
+                    continue
+                seen.add(ref)
+                if self._matches(ref, registry, record_type):
+                    result.append(self.records[ref])
+                    if len(result) >= limit:
+                        return result
+        return result
@@ -23,3 +23,7 @@ def init_config_logging(cfg: ProxyConfig):
         level=cfg.logging.level,
         format=cfg.logging.format,
     )
+
+
+def update_logging_level(cfg: ProxyConfig):
+    logging.getLogger().setLevel(cfg.logging.level)
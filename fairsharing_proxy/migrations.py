@@ -0,0 +1,212 @@
+import datetime
+import sqlite3
+
+from typing import Optional
+
+from fairsharing_proxy.logger import LOG
+
+
+class CacheSchemaError(Exception):
+    pass
+
+
+class Migration:
+
+    def __init__(self, version: int, description: str,
+                 statements: list[str], recrawl=False):
+        self.version = version
+        self.description = description
+        self.statements = statements
+        # incompatible change of stored records, they must be fetched again
+        self.recrawl = recrawl
+
+    def apply(self, cur: sqlite3.Cursor):
+        for statement in self.statements:
+            cur.execute(statement)
+
+
+BASE_VERSION = 1
+
+# forward migrations from BASE_VERSION, ordered by version
+MIGRATIONS = [
+    Migration(
+        version=2,
+        description='Deduplicate meta and records, index records',
+        statements=[
+            '''
+            DELETE FROM meta WHERE rowid NOT IN (
+              SELECT MIN(rowid) FROM meta GROUP BY version
+            );
+            ''',
+            '''
+            DELETE FROM records WHERE rowid NOT IN (
+              SELECT MAX(rowid) FROM records GROUP BY fairsharing_id
+            );
+            ''',
+            '''
+            CREATE UNIQUE INDEX IF NOT EXISTS records_fairsharing_id
+            ON records (fairsharing_id);
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS records_updated_at
+            ON records (updated_at);
+            ''',
+        ],
+    ),
+    Migration(
+        version=3,
+        description='Statistics of search queries',
+        statements=[
+            '''
+            CREATE TABLE IF NOT EXISTS query_stats (
+              query_key     TEXT PRIMARY KEY,
+              params        TEXT,
+              hits          INTEGER,
+              last_seen     TEXT
+            );
+            ''',
+        ],
+    ),
+    Migration(
+        version=4,
+        description='Tombstones of deleted records, index of changes',
+        statements=[
+            '''
+            CREATE TABLE IF NOT EXISTS tombstones (
+              fairsharing_id TEXT PRIMARY KEY,
+              deleted_at     TEXT
+            );
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS tombstones_changes
+            ON tombstones (deleted_at, fairsharing_id);
+            ''',
+            '''
+            DROP INDEX IF EXISTS records_updated_at;
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS records_changes
+            ON records (updated_at, fairsharing_id);
+            ''',
+        ],
+    ),
+    Migration(
+        version=5,
+        description='Persistent search results',
+        statements=[
+            '''
+            CREATE TABLE IF NOT EXISTS results (
+              query_key     TEXT PRIMARY KEY,
+              payload       BLOB,
+              created_at    REAL,
+              ttl           REAL
+            );
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS results_expiry
+            ON results (created_at + ttl);
+            ''',
+        ],
+    ),
+    Migration(
+        version=6,
+        description='Validators for conditional upstream requests',
+        statements=[
+            '''
+            CREATE TABLE IF NOT EXISTS validators (
+              resource      TEXT PRIMARY KEY,
+              etag          TEXT,
+              last_modified TEXT,
+              digest        TEXT,
+              next_url      TEXT,
+              ids           TEXT,
+              checked_at    REAL
+            );
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS validators_checked_at
+            ON validators (checked_at);
+            ''',
+        ],
+    ),
+    Migration(
+        version=7,
+        description='Change feed ordered by local change sequence',
+        statements=[
+            '''
+            CREATE TABLE IF NOT EXISTS changes (
+              seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+              fairsharing_id TEXT UNIQUE,
+              changed_at     TEXT,
+              deleted        INTEGER
+            );
+            ''',
+            # existing records and tombstones in their previous feed order
+            '''
+            INSERT OR REPLACE INTO changes (fairsharing_id, changed_at, deleted)
+            SELECT fairsharing_id, changed_at, deleted FROM (
+              SELECT fairsharing_id, updated_at AS changed_at, 0 AS deleted
+              FROM records
+              UNION ALL
+              SELECT fairsharing_id, deleted_at AS changed_at, 1 AS deleted
+              FROM tombstones
+            ) ORDER BY changed_at, fairsharing_id;
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS changes_changed_at
+            ON changes (changed_at);
+            ''',
+            '''
+            DROP TABLE IF EXISTS tombstones;
+            ''',
+            '''
+            DROP INDEX IF EXISTS records_changes;
+            ''',
+        ],
+    ),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version if MIGRATIONS else BASE_VERSION
+
+
+def _current_version(cur: sqlite3.Cursor) -> Optional[int]:
+    cur.execute('SELECT MAX(version) FROM meta;')
+    return cur.fetchone()[0]
+
+
+def _store_version(cur: sqlite3.Cursor, version: int):
+    now = datetime.datetime.utcnow()
+    cur.execute('''
+        INSERT INTO meta VALUES (?, ?);
+    ''', (version, now.isoformat()))
+
+
+def migrate(cur: sqlite3.Cursor) -> bool:
+    """Upgrade schema to SCHEMA_VERSION, True if records must be re-crawled"""
+    if not cur.connection.in_transaction:
+        # write lock before reading the version, workers starting at once
+        # would otherwise apply the same migrations each
+        cur.execute('BEGIN IMMEDIATE;')
+    version = _current_version(cur)
+    if version is None:
+        _store_version(cur, BASE_VERSION)
+        version = BASE_VERSION
+    if version > SCHEMA_VERSION:
+        raise CacheSchemaError(
+            f'Cache schema version {version} is newer than supported '
+            f'{SCHEMA_VERSION}, use a newer version or a new cache file'
+        )
+    recrawl = False
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        LOG.info(f'[CACHE] Migrating schema to version {migration.version}: '
+                 f'{migration.description}')
+        migration.apply(cur)
+        _store_version(cur, migration.version)
+        recrawl = recrawl or migration.recrawl
+    if recrawl:
+        LOG.warning('[CACHE] Cached records are incompatible, cleared '
+                    '(refresh of the cache is needed)')
+        cur.execute('DELETE FROM records;')
+    return recrawl
@@ -1,12 +1,14 @@
 import datetime
-import fastapi
 import json
 import uuid
 
-from typing import Any, Optional, Mapping
+from typing import TYPE_CHECKING, Any, Optional, Mapping
 
 from fairsharing_proxy.consts import URL_PREFIX, URL_PREFIX_LEN
 
+if TYPE_CHECKING:
+    import fastapi
+
 
 def _to_lower(text: Optional[str]) -> Optional[str]:
     if isinstance(text, str):
@@ -16,11 +18,12 @@ def _to_lower(text: Optional[str]) -> Optional[str]:
 
 class ProxyRequest:
 
-    def __init__(self, request: fastapi.Request):
+    def __init__(self, request: 'fastapi.Request'):
         self.trace_id = str(uuid.uuid4())
         self.ts_started = datetime.datetime.utcnow()
         self.ts_finished = None  # type: Optional[datetime.datetime]
         self.request = request
+        self.client_id = ''  # type: str
 
     @property
     def headers(self):
@@ -38,6 +41,15 @@ class Token:
         self.expiry = int(data.get('expiry', 0))  # type: int
         self.success = data.get('success', False) and self.token != ''
 
+    def to_data(self) -> dict:
+        return {
+            'jwt': self.token,
+            'username': self.username,
+            'message': self.message,
+            'expiry': self.expiry,
+            'success': self.success,
+        }
+
     @property
     def ok(self) -> bool:
         return self.success and self.token != '' and not self.is_expired
@@ -102,6 +114,28 @@ class SearchQuery:
             return SearchQuery.from_params(data)
         return SearchQuery.from_params({})
 
+    def to_params(self) -> dict[str, str]:
+        """Inverse of from_params (only the set values)"""
+        params = {
+            'q': self.query,
+            'registry': self.registry,
+            'status': self.status,
+            'record_type': self.record_type,
+            'countries': self.countries,
+            'subjects': self.subjects,
+            'domains': self.domains,
+            'taxonomies': self.taxonomies,
+            'user_defined_tags': self.user_defined_tags,
+            'is_recommended': self.is_recommended,
+            'is_approved': self.is_approved,
+            'is_maintained': self.is_maintained,
+        }
+        return {k: v for k, v in params.items() if v is not None}
+
+    @property
+    def cache_key(self) -> str:
+        return json.dumps(self.params, sort_keys=True, separators=(',', ':'))
+
     @property
     def params(self) -> dict[str, str]:
         params = {
@@ -265,6 +299,16 @@ class Record:
             'updated_at': self.updated_at,
         }
 
+    def to_suggestion_json(self) -> dict:
+        return {
+            'id': self.fairsharing_id,
+            'registry': self.registry,
+            'record_type': self.record_type,
+            'name': self.name,
+            'abbreviation': self.abbreviation,
+            'doi': self.doi,
+        }
+
     def to_row(self):
         return (
             self.fairsharing_id,
@@ -283,6 +327,8 @@ class Record:
                 'countries': self.countries,
                 'fairsharing_licence': self.fairsharing_licence,
                 'legacy_ids': self.legacy_ids,
+                'homepage': self.homepage,
+                'status': self.status,
             }),
             self.created_at,
             self.updated_at,
@@ -305,6 +351,8 @@ class Record:
         self.countries = additional.get('countries', [])
         self.fairsharing_licence = additional.get('fairsharing_licence', [])
         self.legacy_ids = additional.get('legacy_ids', [])
+        self.homepage = additional.get('homepage', None)
+        self.status = additional.get('status', None)
         self.created_at = data[9]
         self.updated_at = data[10]
 
@@ -0,0 +1,52 @@
+import json
+
+from typing import Any, Optional
+
+from fairsharing_proxy.model import Record
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:  # optional, standard json module is used then
+    HAS_ORJSON = False
+
+
+def decode_json(content: bytes) -> Any:
+    """Decode JSON document, raises ValueError if invalid"""
+    if HAS_ORJSON:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def is_valid_item(item: Any) -> bool:
+    """Same as Record.is_valid but without constructing the record"""
+    if not isinstance(item, dict) or str(item.get('id', '')) == '':
+        return False
+    attrs = item.get('attributes', {})
+    metadata = attrs.get('metadata', {})
+    return metadata.get('name', attrs.get('name', '')) != ''
+
+
+class Payload:
+    """Decoded response of FAIRsharing API (decoded once, used lazily)"""
+
+    def __init__(self, content: bytes):
+        data = decode_json(content)
+        self.data = data if isinstance(data, dict) else {}  # type: dict
+
+    @property
+    def message(self) -> str:
+        return str(self.data.get('message', '') or '')
+
+    @property
+    def items(self) -> list:
+        items = self.data.get('data', [])
+        return items if isinstance(items, list) else []
+
+    @property
+    def next_url(self) -> Optional[str]:
+        return (self.data.get('links', None) or {}).get('next', None)
+
+    def records(self) -> list[Record]:
+        # invalid items are skipped before constructing records
+        return [Record(**item) for item in self.items if is_valid_item(item)]
@@ -0,0 +1,66 @@
+import collections
+import pathlib
+import sys
+import threading
+import time
+
+from types import FrameType
+from typing import Counter, Optional
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    path = pathlib.PurePath(code.co_filename)
+    return f'{code.co_name} ({"/".join(path.parts[-2:])}:{code.co_firstlineno})'
+
+
+def _stack(frame: Optional[FrameType]) -> list[str]:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """Samples stacks of all threads for a limited time
+
+    Nothing runs between profiles, samples are taken only by the thread
+    calling run for the given duration. Result is in the collapsed stack format
+    (one "thread;outer;...;inner count" line per stack) used by
+    flamegraph tools.
+    """
+
+    MIN_INTERVAL = 0.001
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _sample(self, stacks: Counter[str], own_ident: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            thread = names.get(ident, f'thread-{ident}')
+            stacks[';'.join([thread] + _stack(frame))] += 1
+
+    def run(self, duration: float, interval: float) -> str:
+        """Take a profile (blocking), use from a worker thread"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError()
+        try:
+            stacks = collections.Counter()  # type: Counter[str]
+            own_ident = threading.get_ident()
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                self._sample(stacks, own_ident)
+                time.sleep(max(self.MIN_INTERVAL, interval))
+        finally:
+            self._lock.release()
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in sorted(stacks.items()))
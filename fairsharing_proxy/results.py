@@ -0,0 +1,198 @@
+import collections
+import datetime
+import json
+import sqlite3
+import time
+
+from typing import Any, Generic, Optional, OrderedDict, TypeVar, Union
+
+from fairsharing_proxy.database import Database
+from fairsharing_proxy.model import Record, RecordSet, SearchQuery
+
+V = TypeVar('V')
+
+# client errors that depend on credentials or on timing (not on the query)
+_TRANSIENT_CLIENT_ERRORS = frozenset((401, 403, 407, 408, 409, 423, 425, 429))
+
+
+def is_deterministic_error(status_code: int) -> bool:
+    return 400 <= status_code < 500 and \
+        status_code not in _TRANSIENT_CLIENT_ERRORS
+
+
+class CachedError:
+
+    def __init__(self, status_code: int, detail: Any):
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ResultCache(Generic[V]):
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        # least recently used first
+        self._entries = \
+            collections.OrderedDict()  # type: OrderedDict[str, tuple[float, V]]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key, None)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: str) -> Optional[V]:
+        entry = self._entries.get(key, None)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _evict(self):
+        while len(self._entries) > max(0, self.size):
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, value: V, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.size <= 0 or ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def configure(self, size: int, ttl: float):
+        # kept entries expire with the TTL they were stored with
+        self.size = size
+        self.ttl = ttl
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+
+
+class PersistentResultCache:
+    """Second-tier result cache in the cache database
+
+    Shared by workers and kept across restarts, entries expire by wall
+    clock time (created_at + ttl) and are removed by sweep.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    @staticmethod
+    def _encode(value: Union[RecordSet, CachedError]) -> bytes:
+        if isinstance(value, CachedError):
+            data = {'error': {'status_code': value.status_code,
+                              'detail': value.detail}}  # type: dict
+        else:
+            data = {'records': [record.to_row() for record in value.records]}
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def _decode(payload: bytes) -> Union[RecordSet, CachedError]:
+        data = json.loads(payload)
+        if 'error' in data:
+            return CachedError(**data['error'])
+        records = []
+        for row in data['records']:
+            record = Record()
+            record.from_row(row)
+            records.append(record)
+        return RecordSet(records)
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, key: str,
+                now: float) -> Optional[tuple[bytes, float]]:
+        return conn.execute('''
+            SELECT payload, created_at + ttl FROM results
+            WHERE query_key = ? AND created_at + ttl > ?;
+        ''', (key, now)).fetchone()
+
+    async def get(
+            self, key: str,
+    ) -> Optional[tuple[Union[RecordSet, CachedError], float]]:
+        """Cached value and its remaining TTL"""
+        now = time.time()
+        row = await self.db.read(self._select, key, now)
+        if row is None:
+            return None
+        return self._decode(row[0]), row[1] - now
+
+    @staticmethod
+    def _store(conn: sqlite3.Connection, key: str, payload: bytes,
+               created_at: float, ttl: float):
+        conn.execute('''
+            INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?);
+        ''', (key, payload, created_at, ttl))
+
+    async def put(self, key: str, value: Union[RecordSet, CachedError],
+                  ttl: float):
+        if ttl <= 0:
+            return
+        await self.db.write(self._store, key, self._encode(value),
+                            time.time(), ttl)
+
+    @staticmethod
+    def _delete_expired(conn: sqlite3.Connection, now: float) -> int:
+        # served by results_expiry index on (created_at + ttl)
+        return conn.execute('''
+            DELETE FROM results WHERE created_at + ttl <= ?;
+        ''', (now,)).rowcount
+
+    async def sweep(self) -> int:
+        return await self.db.write(self._delete_expired, time.time())
+
+
+class QueryStats:
+    """Frequency of search queries (without any client information)"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._pending = collections.Counter()  # type: collections.Counter[str]
+        self._params = dict()  # type: dict[str, dict[str, str]]
+
+    def record(self, query: SearchQuery):
+        key = query.cache_key
+        self._pending[key] += 1
+        if key not in self._params:
+            self._params[key] = query.to_params()
+
+    @staticmethod
+    def _store(conn: sqlite3.Connection, pending: dict[str, int],
+               params: dict[str, dict[str, str]]):
+        now = datetime.datetime.utcnow().isoformat()
+        conn.executemany('''
+            INSERT INTO query_stats VALUES (?, ?, ?, ?)
+            ON CONFLICT (query_key) DO UPDATE
+            SET hits = hits + excluded.hits, last_seen = excluded.last_seen;
+        ''', [
+            (key, json.dumps(params[key]), hits, now)
+            for key, hits in pending.items()
+        ])
+
+    async def flush(self):
+        if len(self._pending) == 0:
+            return
+        pending, params = dict(self._pending), self._params
+        self._pending, self._params = collections.Counter(), dict()
+        await self.db.write(self._store, pending, params)
+
+    @staticmethod
+    def _select_top(conn: sqlite3.Connection, limit: int) -> list[str]:
+        cur = conn.execute('''
+            SELECT params FROM query_stats
+            ORDER BY hits DESC, last_seen DESC LIMIT ?;
+        ''', (limit,))
+        result = [row[0] for row in cur.fetchall()]
+        cur.close()
+        return result
+
+    async def top(self, limit: int) -> list[SearchQuery]:
+        rows = await self.db.read(self._select_top, limit)
+        return [SearchQuery.from_params(json.loads(row)) for row in rows]
@@ -0,0 +1,277 @@
+import array
+import re
+
+from typing import Optional, Sequence
+
+from fairsharing_proxy.arrays import OFFSET, REF, WEIGHT, EncodedSections, \
+    Numbers, Sections, Strings, find, load_numbers, load_strings, \
+    pack_numbers, pack_strings
+from fairsharing_proxy.columns import FacetColumns, Filters, HAS_NUMPY
+from fairsharing_proxy.index import normalize_text
+from fairsharing_proxy.model import Record, SearchQuery
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+FIELD_WEIGHTS = {
+    'abbreviation': 4.0,
+    'name': 3.0,
+    'tags': 2.0,
+    'description': 1.0,
+}
+
+# single-valued filters compared with the record attribute
+_SINGLE_FACETS = {
+    'registry': 'registry',
+    'record_type': 'record_type',
+    'status': 'status',
+}
+# multi-valued filters, any of the comma-separated values must be present
+_MULTI_FACETS = {
+    'subjects': 'subjects',
+    'domains': 'domains',
+    'taxonomies': 'taxonomies',
+    'countries': 'countries',
+    'user_defined_tags': 'user_defined_tags',
+}
+# filters that cannot be evaluated locally (not part of cached records)
+_UPSTREAM_ONLY_FACETS = ('is_recommended', 'is_approved', 'is_maintained')
+
+# numeric arrays of the index stored in snapshots
+_ARRAYS = (
+    ('order', REF),
+    ('token_grams', REF),
+    ('posting_offsets', OFFSET),
+    ('posting_refs', REF),
+    ('posting_weights', WEIGHT),
+    ('gram_offsets', OFFSET),
+    ('gram_tokens', REF),
+)
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    if not text:
+        return []
+    return _TOKEN_PATTERN.findall(normalize_text(text))
+
+
+def trigrams(token: str) -> frozenset[str]:
+    padded = f' {token} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _split_values(value: Optional[str]) -> Optional[frozenset[str]]:
+    if value is None or value == '':
+        return None
+    return frozenset(v.strip().lower() for v in value.split(',') if v.strip())
+
+
+def can_search_locally(query: SearchQuery) -> bool:
+    return all(getattr(query, facet) is None for facet in _UPSTREAM_ONLY_FACETS)
+
+
+class LocalSearchIndex:
+    """Ranked search in flat arrays (built in memory or mapped from snapshot)
+
+    Vocabulary is sorted, postings of its tokens (records with weights) and
+    tokens of trigrams are stored in CSR layout (offsets per token/trigram
+    into one array).
+    """
+
+    FUZZY_THRESHOLD = 0.45
+    FUZZY_MIN_LENGTH = 4
+    PREFIX_FACTOR = 0.8
+    EXACT_NAME_BONUS = 5.0
+    EXPANSIONS_LIMIT = 10000
+
+    def __init__(self):
+        self.records = []  # type: Sequence[Record]
+        self.names = []  # type: Strings
+        self.ids = []  # type: Strings
+        self.abbreviations = []  # type: Strings
+        self.order = array.array(REF)  # type: Numbers
+        self.columns = FacetColumns(_SINGLE_FACETS, _MULTI_FACETS, HAS_NUMPY)
+        self.tokens = []  # type: Strings
+        self.token_grams = array.array(REF)  # type: Numbers
+        self.posting_offsets = array.array(OFFSET, [0])  # type: Numbers
+        self.posting_refs = array.array(REF)  # type: Numbers
+        self.posting_weights = array.array(WEIGHT)  # type: Numbers
+        self.grams = []  # type: Strings
+        self.gram_offsets = array.array(OFFSET, [0])  # type: Numbers
+        self.gram_tokens = array.array(REF)  # type: Numbers
+        self._expansions = dict()  # type: dict[str, list[tuple[int, float]]]
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def _record_fields(record: Record) -> dict[str, list[str]]:
+        tags = record.subjects + record.domains + \
+            record.taxonomies + record.user_defined_tags
+        return {
+            'abbreviation': tokenize(record.abbreviation),
+            'name': tokenize(record.name),
+            'tags': [t for tag in tags for t in tokenize(tag)],
+            'description': tokenize(record.description),
+        }
+
+    def _build_postings(self, records: list[Record]):
+        postings = dict()  # type: dict[str, dict[int, float]]
+        for ref, record in enumerate(records):
+            for field, tokens in self._record_fields(record).items():
+                weight = FIELD_WEIGHTS[field]
+                for token in set(tokens):
+                    weights = postings.setdefault(token, dict())
+                    weights[ref] = weights.get(ref, 0.0) + weight
+        self.tokens = sorted(postings.keys())
+        self.posting_offsets = array.array(OFFSET, [0])
+        self.posting_refs = array.array(REF)
+        self.posting_weights = array.array(WEIGHT)
+        for token in self.tokens:
+            self.posting_refs.extend(postings[token].keys())
+            self.posting_weights.extend(postings[token].values())
+            self.posting_offsets.append(len(self.posting_refs))
+
+    def _build_trigrams(self):
+        token_grams = array.array(REF)
+        gram_tokens = dict()  # type: dict[str, list[int]]
+        for number, token in enumerate(self.tokens):
+            grams = trigrams(token)
+            token_grams.append(len(grams))
+            for gram in grams:
+                gram_tokens.setdefault(gram, []).append(number)
+        self.token_grams = token_grams
+        self.grams = sorted(gram_tokens.keys())
+        self.gram_offsets = array.array(OFFSET, [0])
+        self.gram_tokens = array.array(REF)
+        for gram in self.grams:
+            self.gram_tokens.extend(gram_tokens[gram])
+            self.gram_offsets.append(len(self.gram_tokens))
+
+    def build(self, records: list[Record]):
+        self._build_postings(records)
+        self._build_trigrams()
+        self.names = [normalize_text(r.name) for r in records]
+        self.ids = [r.fairsharing_id for r in records]
+        self.abbreviations = [r.abbreviation.lower() for r in records]
+        self.order = array.array(REF, sorted(range(len(records)), key=lambda r: (
+            self.names[r], self.ids[r],
+        )))
+        self.columns = FacetColumns(_SINGLE_FACETS, _MULTI_FACETS, HAS_NUMPY)
+        self.columns.build(records, self.order)
+        self._expansions = dict()
+        self.records = records
+
+    def to_sections(self, prefix: str) -> EncodedSections:
+        sections = dict()  # type: EncodedSections
+        for name in ('names', 'ids', 'abbreviations', 'tokens', 'grams'):
+            sections.update(pack_strings(f'{prefix}.{name}', getattr(self, name)))
+        for name, typecode in _ARRAYS:
+            sections.update(pack_numbers(f'{prefix}.{name}', typecode,
+                                         getattr(self, name)))
+        sections.update(self.columns.to_sections(f'{prefix}.facets'))
+        return sections
+
+    def load_sections(self, sections: Sections, prefix: str,
+                      records: Sequence[Record]):
+        """Use index mapped from a snapshot (records are decoded on access)"""
+        for name in ('names', 'ids', 'abbreviations', 'tokens', 'grams'):
+            setattr(self, name, load_strings(sections, f'{prefix}.{name}'))
+        for name, typecode in _ARRAYS:
+            setattr(self, name, load_numbers(sections, f'{prefix}.{name}', typecode))
+        self.columns = FacetColumns(_SINGLE_FACETS, _MULTI_FACETS, HAS_NUMPY)
+        self.columns.load_sections(sections, f'{prefix}.facets', len(records),
+                                   self.order)
+        self._expansions = dict()
+        self.records = records
+
+    def _candidates(self, grams: frozenset[str]) -> dict[int, int]:
+        """Tokens sharing some trigrams with the number of shared ones"""
+        shared = dict()  # type: dict[int, int]
+        for gram in grams:
+            position = find(self.grams, gram)
+            if position is None:
+                continue
+            start, end = self.gram_offsets[position], self.gram_offsets[position + 1]
+            for number in self.gram_tokens[start:end]:
+                shared[number] = shared.get(number, 0) + 1
+        return shared
+
+    def _expand(self, token: str) -> list[tuple[int, float]]:
+        """Vocabulary tokens (numbers) similar to the query token with similarity"""
+        if token in self._expansions:
+            return self._expansions[token]
+        expansion = dict()  # type: dict[int, float]
+        exact = find(self.tokens, token)
+        if exact is not None:
+            expansion[exact] = 1.0
+        grams = trigrams(token)
+        for candidate, shared in self._candidates(grams).items():
+            if candidate == exact:
+                continue
+            if self.tokens[candidate].startswith(token):
+                expansion[candidate] = self.PREFIX_FACTOR
+            elif len(token) >= self.FUZZY_MIN_LENGTH:
+                # Jaccard similarity of trigram sets
+                union = len(grams) + self.token_grams[candidate] - shared
+                similarity = shared / union
+                if similarity >= self.FUZZY_THRESHOLD:
+                    expansion[candidate] = similarity * self.PREFIX_FACTOR
+        result = sorted(expansion.items())
+        if len(self._expansions) >= self.EXPANSIONS_LIMIT:
+            self._expansions.clear()
+        self._expansions[token] = result
+        return result
+
+    def _score_token(self, token: str) -> dict[int, float]:
+        scores = dict()  # type: dict[int, float]
+        for candidate, similarity in self._expand(token):
+            start = self.posting_offsets[candidate]
+            end = self.posting_offsets[candidate + 1]
+            for ref, weight in zip(self.posting_refs[start:end],
+                                   self.posting_weights[start:end]):
+                score = similarity * weight
+                if score > scores.get(ref, 0.0):
+                    scores[ref] = score
+        return scores
+
+    def _browse(self, filters: Filters, limit: int) -> list[Record]:
+        """Matching records ordered by name"""
+        return [self.records[ref] for ref in self.columns.select(filters, limit)]
+
+    @staticmethod
+    def _filters(query: SearchQuery) -> Filters:
+        filters = []
+        for facet in list(_SINGLE_FACETS.keys()) + list(_MULTI_FACETS.keys()):
+            values = _split_values(getattr(query, facet))
+            if values is not None:
+                filters.append((facet, values))
+        return filters
+
+    def search(self, query: SearchQuery, limit: int) -> list[Record]:
+        filters = self._filters(query)
+        tokens = list(dict.fromkeys(tokenize(query.query)))
+        if len(tokens) == 0:
+            return self._browse(filters, limit)
+        totals = None  # type: Optional[dict[int, float]]
+        for token in tokens:
+            scores = self._score_token(token)
+            if totals is None:
+                totals = scores
+            else:
+                # all query tokens must match (possibly fuzzily)
+                totals = {ref: totals[ref] + score
+                          for ref, score in scores.items() if ref in totals}
+            if len(totals) == 0:
+                return []
+        phrase = ' '.join(tokens)
+        matches = self.columns.matcher(filters)
+        ranked = []  # type: list[tuple[float, str, str, int]]
+        for ref, score in (totals or {}).items():
+            if not matches(ref):
+                continue
+            name = self.names[ref]
+            if name == phrase or self.abbreviations[ref] == phrase:
+                score += self.EXACT_NAME_BONUS
+            ranked.append((-round(score, 6), name, self.ids[ref], ref))
+        ranked.sort()
+        return [self.records[item[3]] for item in ranked[:limit]]
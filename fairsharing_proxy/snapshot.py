@@ -0,0 +1,310 @@
+import datetime
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import struct
+
+from typing import Optional, Sequence
+
+from fairsharing_proxy.arrays import REF, EncodedSections, Sections, \
+    load_numbers, load_strings, pack_blobs, pack_numbers
+from fairsharing_proxy.index import PrefixIndex, RecordLookupIndex
+from fairsharing_proxy.logger import LOG
+from fairsharing_proxy.model import Record
+from fairsharing_proxy.payload import decode_json
+from fairsharing_proxy.search import LocalSearchIndex
+
+# Layout of a snapshot file:
+#
+#   header    MAGIC, format version, number of records, size of the table
+#             (little-endian)
+#   table     JSON object with offset and size of every section by name
+#   sections  flat arrays (native byte order, aligned to 8 bytes), see
+#             arrays.py: offsets and blobs of pre-encoded Record.to_json
+#             and Record.to_row, sorted lookup keys with record numbers,
+#             prefix index and search index (with facet columns)
+#
+# Snapshots are immutable, a new one is written for every refresh and
+# the POINTER file is atomically replaced to point to it.
+#
+# Workers serve lookups, autocomplete and local search from the mapped
+# file, pages are shared by all of them. Records are decoded only when
+# returned (recently decoded ones are kept per worker, CACHE_LIMIT).
+
+MAGIC = b'FSPSNAP\x00'
+FORMAT_VERSION = 2
+POINTER = 'CURRENT'
+KEEP_SNAPSHOTS = 2
+
+_HEADER = struct.Struct('<8sIIQ')
+_ALIGNMENT = 8
+
+# lookup key kinds in the order of precedence (same as RecordLookupIndex)
+_KINDS = (
+    ('i', 'by_id'),
+    ('d', 'by_doi'),
+    ('l', 'by_legacy_id'),
+    ('s', 'by_slug'),
+)
+
+# prefixes of sections of indexes
+PREFIXES = 'prefixes'
+SEARCH = 'search'
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+def encode_json(data) -> bytes:
+    return json.dumps(
+        data,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(',', ':'),
+    ).encode('utf-8')
+
+
+def write_atomic(path: pathlib.Path, data: bytes):
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    with tmp_path.open('wb') as fp:
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+
+
+def _lookup_keys(records: list[Record]) -> list[tuple[bytes, int]]:
+    refs = {id(record): ref for ref, record in enumerate(records)}
+    index = RecordLookupIndex()
+    index.build(records)
+    keys = []
+    for kind, attr in _KINDS:
+        for key, record in getattr(index, attr).items():
+            keys.append((f'{kind}:{key}'.encode('utf-8'), refs[id(record)]))
+    keys.sort()
+    return keys
+
+
+def _encode_sections(records: list[Record]) -> EncodedSections:
+    sections = dict()  # type: EncodedSections
+    sections.update(pack_blobs('json', [encode_json(r.to_json()) for r in records]))
+    sections.update(pack_blobs('rows', [encode_json(r.to_row()) for r in records]))
+    keys = _lookup_keys(records)
+    sections.update(pack_blobs('keys', [key for key, _ in keys]))
+    sections.update(pack_numbers('keys.refs', REF, [ref for _, ref in keys]))
+    prefixes = PrefixIndex()
+    prefixes.build(records)
+    sections.update(prefixes.to_sections(PREFIXES))
+    search = LocalSearchIndex()
+    search.build(records)
+    sections.update(search.to_sections(SEARCH))
+    return sections
+
+
+def encode_snapshot(records: list[Record]) -> bytes:
+    sections = _encode_sections(records)
+    # positions are relative to the end of the table
+    table = dict()  # type: dict[str, tuple[int, int]]
+    position = 0
+    for name, data in sections.items():
+        position += -position % _ALIGNMENT
+        table[name] = (position, len(data))
+        position += len(data)
+    encoded_table = encode_json(table)
+    encoded_table += b' ' * (-(_HEADER.size + len(encoded_table)) % _ALIGNMENT)
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(records),
+                          len(encoded_table)), encoded_table]
+    position = 0
+    for name, data in sections.items():
+        parts.append(b'\x00' * (table[name][0] - position))
+        parts.append(data)
+        position = table[name][0] + len(data)
+    return b''.join(parts)
+
+
+class Snapshot:
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.sections = dict()  # type: Sections
+        with path.open('rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self):
+        if len(self._view) < _HEADER.size:
+            raise SnapshotFormatError(f'Truncated snapshot: {self.path}')
+        magic, version, count, table_size = _HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC:
+            raise SnapshotFormatError(f'Not a snapshot: {self.path}')
+        if version != FORMAT_VERSION:
+            raise SnapshotFormatError(
+                f'Unsupported snapshot version {version}: {self.path}'
+            )
+        self.count = count  # type: int
+        base = _HEADER.size + table_size
+        table = json.loads(bytes(self._view[_HEADER.size:base]))
+        for name, (start, size) in table.items():
+            if base + start + size > len(self._view):
+                raise SnapshotFormatError(f'Truncated snapshot: {self.path}')
+            self.sections[name] = self._view[base + start:base + start + size]
+        self._json = load_strings(self.sections, 'json')
+        self._rows = load_strings(self.sections, 'rows')
+        self._keys = load_strings(self.sections, 'keys')
+        self._key_refs = load_numbers(self.sections, 'keys.refs', REF)
+        self.keys = len(self._keys)  # type: int
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        # views must be released before the mmap can be closed, if some
+        # are still referenced (e.g. by indexes), the mapping is left to GC
+        try:
+            for view in self.sections.values():
+                view.release()
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def record_json(self, ref: int) -> memoryview:
+        return self._json.blob[self._json.offsets[ref]:self._json.offsets[ref + 1]]
+
+    def record(self, ref: int) -> Record:
+        row = self._rows.blob[self._rows.offsets[ref]:self._rows.offsets[ref + 1]]
+        record = Record()
+        record.from_row(decode_json(bytes(row)))
+        return record
+
+    def records(self) -> 'SnapshotRecords':
+        """Records decoded on access"""
+        return SnapshotRecords(self)
+
+    def _key(self, position: int) -> bytes:
+        offsets = self._keys.offsets
+        return bytes(self._keys.blob[offsets[position]:offsets[position + 1]])
+
+    def _find_key(self, key: bytes) -> Optional[int]:
+        lo, hi = 0, self.keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.keys and self._key(lo) == key:
+            return self._key_refs[lo]
+        return None
+
+    def find(self, identifier: str) -> Optional[int]:
+        for kind, key in RecordLookupIndex.candidate_keys(identifier):
+            ref = self._find_key(f'{kind}:{key}'.encode('utf-8'))
+            if ref is not None:
+                return ref
+        return None
+
+    def prefix_index(self) -> PrefixIndex:
+        index = PrefixIndex()
+        index.load_sections(self.sections, PREFIXES, self.records())
+        return index
+
+    def search_index(self) -> LocalSearchIndex:
+        index = LocalSearchIndex()
+        index.load_sections(self.sections, SEARCH, self.records())
+        return index
+
+
+class SnapshotRecords(Sequence[Record]):
+    """Records of a snapshot as a sequence, decoded ones are kept up to
+    CACHE_LIMIT (then dropped at once)"""
+
+    CACHE_LIMIT = 1000
+
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        self._decoded = dict()  # type: dict[int, Record]
+
+    def __len__(self):
+        return self.snapshot.count
+
+    def __getitem__(self, ref: int) -> Record:  # type: ignore
+        record = self._decoded.get(ref, None)
+        if record is not None:
+            return record
+        if ref < 0 or ref >= self.snapshot.count:
+            raise IndexError(ref)
+        record = self.snapshot.record(ref)
+        if len(self._decoded) >= self.CACHE_LIMIT:
+            self._decoded.clear()
+        self._decoded[ref] = record
+        return record
+
+
+class SnapshotStore:
+
+    def __init__(self, directory: str):
+        self.directory = pathlib.Path(directory)
+        self.current = None  # type: Optional[Snapshot]
+
+    @property
+    def _pointer(self) -> pathlib.Path:
+        return self.directory / POINTER
+
+    def _read_pointer(self) -> Optional[str]:
+        try:
+            return self._pointer.read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            return None
+
+    def publish(self, records: list[Record]) -> pathlib.Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = encode_snapshot(records)
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        path = self.directory / f'records-{now}-{digest}.snap'
+        write_atomic(path, data)
+        write_atomic(self._pointer, path.name.encode('utf-8'))
+        LOG.info(f'[SNAPSHOT] Published {path.name} ({len(records)} records)')
+        self._cleanup(keep=path.name)
+        return path
+
+    def _cleanup(self, keep: str):
+        # unlinking is safe for workers that still have the old one mapped
+        snapshots = sorted(
+            (p for p in self.directory.glob('records-*.snap') if p.name != keep),
+            key=lambda p: p.name,
+        )
+        for path in snapshots[:max(0, len(snapshots) - KEEP_SNAPSHOTS + 1)]:
+            path.unlink(missing_ok=True)
+
+    def refresh(self) -> bool:
+        """Open the snapshot from pointer if it changed, True if it did"""
+        name = self._read_pointer()
+        if name is None:
+            return False
+        if self.current is not None and self.current.path.name == name:
+            return False
+        try:
+            snapshot = Snapshot(self.directory / name)
+        except (OSError, ValueError, SnapshotFormatError) as e:
+            LOG.warning(f'[SNAPSHOT] Failed to open {name}: {str(e)}')
+            return False
+        # the previous one is not closed, requests in progress may still
+        # read it, it is unmapped by GC once nothing references it
+        self.current = snapshot
+        LOG.info(f'[SNAPSHOT] Opened {name} ({len(snapshot)} records)')
+        return True
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
@@ -0,0 +1,181 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import sqlite3
+
+from typing import Optional
+
+from fairsharing_proxy.config import ProxyConfig
+from fairsharing_proxy.database import Database
+from fairsharing_proxy.logger import LOG
+from fairsharing_proxy.model import Token
+
+
+_QUERY_CREATE_TABLE_TOKENS = '''
+    CREATE TABLE IF NOT EXISTS tokens (
+      user_key      TEXT PRIMARY KEY,
+      payload       BLOB,
+      expiry        INTEGER
+    );
+'''
+
+
+class TokenStore:
+
+    def __init__(self):
+        self._tokens = dict()  # type: dict[str, Token]
+
+    async def prepare(self):
+        pass
+
+    def has_token(self, username: str) -> bool:
+        return username in self._tokens
+
+    def get_token(self, username: str) -> Token:
+        return self._tokens[username]
+
+    def _has_usable_token(self, username: str) -> bool:
+        if not self.has_token(username):
+            return False
+        return not self.get_token(username).should_refresh
+
+    async def has_usable_token(self, username: str) -> bool:
+        return self._has_usable_token(username)
+
+    async def clear_token(self, username: str):
+        self._tokens.pop(username, None)
+
+    async def store_token(self, username: str, token: Token):
+        self._tokens[username] = token
+
+    async def close(self):
+        self._tokens.clear()
+
+
+class PersistentTokenStore(TokenStore):
+    """Token store backed by SQLite, shared by workers and restarts
+
+    Tokens are stored encrypted (Fernet) and usernames only as keyed
+    hashes, both derived from the configured secret. The database is
+    accessed from worker threads only (it can be the cache database).
+    """
+
+    def __init__(self, secret: str, db: Database, owns_db: bool):
+        super().__init__()
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            raise RuntimeError(
+                'Persistent token store requires "cryptography" package '
+                '(install fairsharing_proxy[tokens])'
+            )
+        key = hashlib.sha256(f'fernet:{secret}'.encode('utf-8')).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(key))
+        self._hmac_key = hashlib.sha256(f'hmac:{secret}'.encode('utf-8')).digest()
+        self.db = db
+        self._owns_db = owns_db
+
+    def _user_key(self, username: str) -> str:
+        return hmac.new(
+            key=self._hmac_key,
+            msg=username.encode('utf-8'),
+            digestmod=hashlib.sha256,
+        ).hexdigest()
+
+    @staticmethod
+    def _now() -> int:
+        return int(datetime.datetime.utcnow().timestamp())
+
+    @staticmethod
+    def _delete_expired(conn: sqlite3.Connection, now: int):
+        conn.execute('''
+            DELETE FROM tokens WHERE expiry <= ?;
+        ''', (now,))
+
+    @staticmethod
+    def _init_table(conn: sqlite3.Connection, now: int):
+        conn.execute(_QUERY_CREATE_TABLE_TOKENS)
+        PersistentTokenStore._delete_expired(conn, now)
+
+    async def prepare(self):
+        await self.db.write(self._init_table, self._now())
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, user_key: str,
+                now: int) -> Optional[tuple]:
+        return conn.execute('''
+            SELECT payload FROM tokens WHERE user_key = ? AND expiry > ?;
+        ''', (user_key, now)).fetchone()
+
+    async def _load_token(self, username: str) -> bool:
+        row = await self.db.read(self._select, self._user_key(username),
+                                 self._now())
+        if row is None:
+            return False
+        try:
+            data = json.loads(self._fernet.decrypt(row[0]))
+        except Exception as e:
+            LOG.warning(f'[TOKENS] Dropping unreadable stored token: {str(e)}')
+            await self.clear_token(username)
+            return False
+        self._tokens[username] = Token(data)
+        return True
+
+    async def has_usable_token(self, username: str) -> bool:
+        if self._has_usable_token(username):
+            return True
+        # another worker may have refreshed the token meanwhile
+        self._tokens.pop(username, None)
+        return await self._load_token(username) and \
+            self._has_usable_token(username)
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, user_key: str):
+        conn.execute('''
+            DELETE FROM tokens WHERE user_key = ?;
+        ''', (user_key,))
+
+    async def clear_token(self, username: str):
+        await super().clear_token(username)
+        await self.db.write(self._delete, self._user_key(username))
+
+    @staticmethod
+    def _store(conn: sqlite3.Connection, user_key: str, payload: bytes,
+               expiry: int, now: int):
+        conn.execute('''
+            INSERT OR REPLACE INTO tokens VALUES (?, ?, ?);
+        ''', (user_key, payload, expiry))
+        PersistentTokenStore._delete_expired(conn, now)
+
+    async def store_token(self, username: str, token: Token):
+        await super().store_token(username, token)
+        payload = self._fernet.encrypt(json.dumps(token.to_data()).encode('utf-8'))
+        await self.db.write(self._store, self._user_key(username), payload,
+                            token.expiry, self._now())
+
+    async def close(self):
+        await super().close()
+        if self._owns_db:
+            await asyncio.to_thread(self.db.close)
+
+
+def create_token_store(cfg: ProxyConfig,
+                       cache_db: Optional[Database] = None) -> TokenStore:
+    if not cfg.tokens.persistent:
+        return TokenStore()
+    LOG.info(f'[TOKENS] Using persistent token store: {cfg.tokens.filename}')
+    # the same file as cache shares its database (and writer thread)
+    if cache_db is not None and cache_db.filename == cfg.tokens.filename:
+        return PersistentTokenStore(
+            secret=cfg.tokens.secret,
+            db=cache_db,
+            owns_db=False,
+        )
+    return PersistentTokenStore(
+        secret=cfg.tokens.secret,
+        db=Database(filename=cfg.tokens.filename, readers=1),
+        owns_db=True,
+    )
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from typing import Mapping, Optional
+
+from fairsharing_proxy.database import Database
+from fairsharing_proxy.model import Record
+
+# resources of FAIRsharing API with validators: pages of the crawl
+# (by URL) and search queries (by cache key)
+PAGE = 'page'
+QUERY = 'query'
+
+
+def content_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class Validators:
+    """Validators of the last response for an upstream resource
+
+    ETag and Last-Modified are sent back with the next request, if upstream
+    does not support them, digest of the content is compared instead.
+    Records of the response are kept only as identifiers (they are cached
+    in records table).
+    """
+
+    def __init__(self, etag: Optional[str], last_modified: Optional[str],
+                 digest: str, ids: list[str], next_url: Optional[str] = None,
+                 checked_at: Optional[float] = None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.ids = ids
+        self.next_url = next_url
+        self.checked_at = time.time() if checked_at is None else checked_at
+
+    @staticmethod
+    def from_headers(headers: Mapping[str, str], digest: str, ids: list[str],
+                     next_url: Optional[str]) -> 'Validators':
+        return Validators(
+            etag=headers.get('ETag', None),
+            last_modified=headers.get('Last-Modified', None),
+            digest=digest,
+            ids=ids,
+            next_url=next_url,
+        )
+
+    def revalidated(self, headers: Mapping[str, str]) -> 'Validators':
+        """Same content confirmed, upstream may send updated validators"""
+        return Validators(
+            etag=headers.get('ETag', self.etag),
+            last_modified=headers.get('Last-Modified', self.last_modified),
+            digest=self.digest,
+            ids=self.ids,
+            next_url=self.next_url,
+        )
+
+    def request_headers(self) -> dict[str, str]:
+        headers = dict()
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_row(self, resource: str) -> tuple:
+        return (
+            resource,
+            self.etag,
+            self.last_modified,
+            self.digest,
+            self.next_url,
+            json.dumps(self.ids, separators=(',', ':')),
+            self.checked_at,
+        )
+
+    @staticmethod
+    def from_row(row: tuple) -> 'Validators':
+        return Validators(
+            etag=row[1],
+            last_modified=row[2],
+            digest=row[3],
+            next_url=row[4],
+            ids=json.loads(row[5]),
+            checked_at=row[6],
+        )
+
+
+def _resource(kind: str, name: str) -> str:
+    return f'{kind}:{name}'
+
+
+class ValidatorStore:
+    """Validators of upstream resources in the cache database"""
+
+    MAX_AGE = 7 * 24 * 3600  # seconds since last check
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, resource: str) -> Optional[tuple]:
+        return conn.execute('''
+            SELECT * FROM validators WHERE resource = ?;
+        ''', (resource,)).fetchone()
+
+    async def get(self, kind: str, name: str) -> Optional[Validators]:
+        row = await self.db.read(self._select, _resource(kind, name))
+        return None if row is None else Validators.from_row(row)
+
+    @staticmethod
+    def _select_kind(conn: sqlite3.Connection, kind: str) -> list[tuple]:
+        # range on primary key instead of LIKE (case-insensitive)
+        cur = conn.execute('''
+            SELECT * FROM validators WHERE resource >= ? AND resource < ?;
+        ''', (f'{kind}:', f'{kind};'))
+        result = cur.fetchall()
+        cur.close()
+        return result
+
+    async def get_all(self, kind: str) -> dict[str, Validators]:
+        rows = await self.db.read(self._select_kind, kind)
+        prefix_len = len(kind) + 1
+        return {row[0][prefix_len:]: Validators.from_row(row) for row in rows}
+
+    @staticmethod
+    def _store(conn: sqlite3.Connection, rows: list[tuple]):
+        conn.executemany('''
+            INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?, ?, ?);
+        ''', rows)
+
+    async def put(self, kind: str, name: str, validators: Validators):
+        await self.db.write(self._store, [validators.to_row(_resource(kind, name))])
+
+    @staticmethod
+    def _replace_kind(conn: sqlite3.Connection, kind: str, rows: list[tuple]):
+        conn.execute('''
+            DELETE FROM validators WHERE resource >= ? AND resource < ?;
+        ''', (f'{kind}:', f'{kind};'))
+        ValidatorStore._store(conn, rows)
+
+    async def replace_all(self, kind: str, validators: dict[str, Validators]):
+        """Replace validators of all resources of the kind (e.g. pages)"""
+        await self.db.write(self._replace_kind, kind, [
+            v.to_row(_resource(kind, name)) for name, v in validators.items()
+        ])
+
+    @staticmethod
+    def _delete_old(conn: sqlite3.Connection, checked_before: float) -> int:
+        return conn.execute('''
+            DELETE FROM validators WHERE checked_at < ?;
+        ''', (checked_before,)).rowcount
+
+    async def sweep(self) -> int:
+        return await self.db.write(self._delete_old, time.time() - self.MAX_AGE)
+
+    @staticmethod
+    def _select_records(conn: sqlite3.Connection,
+                        ids: list[str]) -> dict[str, Record]:
+        cur = conn.execute('''
+            SELECT * FROM records
+            WHERE fairsharing_id IN (SELECT value FROM json_each(?));
+        ''', (json.dumps(ids),))
+        records = dict()
+        for row in cur.fetchall():
+            record = Record()
+            record.from_row(row)
+            records[record.fairsharing_id] = record
+        cur.close()
+        return records
+
+    async def find_records(self, ids: list[str]) -> Optional[list[Record]]:
+        """Cached records in the given order, None if any is missing"""
+        if len(ids) == 0:
+            return []
+        records = await self.db.read(self._select_records, ids)
+        if any(fid not in records for fid in ids):
+            return None
+        return [records[fid] for fid in ids]
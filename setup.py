@@ -30,6 +30,12 @@ setup(
         'PyYAML',
         'uvicorn[standard]',
     ],
+    extras_require={
+        'tokens': ['cryptography'],
+        'zstd': ['zstandard'],
+        'search': ['numpy'],
+        'json': ['orjson'],
+    },
     entry_points={
         'console_scripts': [
             'fairsharing_proxy=fairsharing_proxy:main',
@@ -0,0 +1,24 @@
+import asyncio
+
+from fairsharing_proxy.admission import AdmissionController
+
+
+def test_release_skips_cancelled_waiter():
+    async def scenario():
+        admission = AdmissionController(global_limit=1, client_limit=1,
+                                        queue_limit=5)
+        await admission.acquire('a')
+        waiter = asyncio.create_task(admission.acquire('b'))
+        await asyncio.sleep(0)
+        assert admission.queued == 1
+        # cancelled and released in the same tick
+        waiter.cancel()
+        admission.release('a')
+        assert admission.active == 0
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert admission.queued == 0
+        # the slot is still usable by others
+        await asyncio.wait_for(admission.acquire('c'), timeout=1)
+        assert admission.active == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+import sqlite3
+
+from fairsharing_proxy import migrations
+from fairsharing_proxy.cache import RecordsCache
+
+
+def _connect(filename: str, timeout: float) -> sqlite3.Connection:
+    conn = sqlite3.connect(filename, timeout=timeout)
+    conn.execute('PRAGMA journal_mode=WAL;')
+    return conn
+
+
+def test_concurrent_migrations_are_serialized(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'cache.db')
+    first = _connect(filename, timeout=30)
+    second = _connect(filename, timeout=0.1)
+    errors = []
+    read_version = migrations._current_version
+
+    def current_version(cur: sqlite3.Cursor):
+        version = read_version(cur)
+        if cur.connection is first:
+            # another worker starts right after the first one read it
+            try:
+                RecordsCache._init_tables(second)
+                second.commit()
+            except sqlite3.OperationalError as e:
+                second.rollback()
+                errors.append(e)
+        return version
+
+    monkeypatch.setattr(migrations, '_current_version', current_version)
+    RecordsCache._init_tables(first)
+    first.commit()
+    assert len(errors) == 1 and 'locked' in str(errors[0])
+    # once the first one is done, there is nothing to migrate
+    RecordsCache._init_tables(second)
+    second.commit()
+    versions = [row[0] for row in first.execute(
+        'SELECT version FROM meta ORDER BY version;'
+    )]
+    assert versions == list(range(1, migrations.SCHEMA_VERSION + 1))
+    first.close()
+    second.close()
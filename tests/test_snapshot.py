@@ -0,0 +1,66 @@
+import json
+
+from fairsharing_proxy.index import PrefixIndex
+from fairsharing_proxy.model import Record, SearchQuery
+from fairsharing_proxy.search import LocalSearchIndex
+from fairsharing_proxy.snapshot import SnapshotStore
+
+
+def _record(number: int, name: str, registry: str = 'Standard') -> Record:
+    record = Record(**{
+        'id': str(number),
+        'attributes': {
+            'fairsharing_registry': registry,
+            'record_type': 'terminology_artefact',
+            'abbreviation': f'R{number}',
+            'name': name,
+            'url': f'https://fairsharing.org/{number}',
+            'metadata': {'name': name},
+        },
+    })
+    record.rectify()
+    return record
+
+
+def test_swapped_snapshot_stays_readable(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.publish([_record(1, 'First')])
+    assert store.refresh()
+    # reader holding the snapshot while a refresh swaps in another one
+    snapshot = store.current
+    assert snapshot is not None
+    store.publish([_record(1, 'Second'), _record(2, 'Third')])
+    assert store.refresh()
+    assert store.current is not snapshot
+    ref = snapshot.find('1')
+    assert ref is not None
+    assert json.loads(bytes(snapshot.record_json(ref)))['name'] == 'First'
+    store.close()
+
+
+def test_mapped_indexes_match_built_ones(tmp_path):
+    records = [
+        _record(1, 'Gene Ontology'),
+        _record(2, 'Genome Database', 'Database'),
+        _record(3, 'Protein Ontology'),
+        _record(4, 'Ontology Lookup Service', 'Database'),
+    ]
+    store = SnapshotStore(str(tmp_path))
+    store.publish(records)
+    assert store.refresh()
+    snapshot = store.current
+    assert snapshot is not None
+    prefixes, search = PrefixIndex(), LocalSearchIndex()
+    prefixes.build(records)
+    search.build(records)
+    mapped_prefixes, mapped_search = snapshot.prefix_index(), snapshot.search_index()
+    for prefix in ('gen', 'onto', 'r3', 'x'):
+        assert [r.fairsharing_id for r in mapped_prefixes.suggest(prefix)] == \
+            [r.fairsharing_id for r in prefixes.suggest(prefix)]
+    for params in ({'q': 'ontology'}, {'q': 'genom'},
+                   {'q': 'ontology', 'registry': 'database'},
+                   {'registry': 'standard'}):
+        query = SearchQuery.from_params(params)
+        assert [r.fairsharing_id for r in mapped_search.search(query, 10)] == \
+            [r.fairsharing_id for r in search.search(query, 10)]
+    store.close()